@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Compares the NumPy analytics engine against the SQLite period summaries,
+over a synthetic history, and checks that they agree.
+
+    python benchmarks/bench_analytics.py --entries 1000000
+
+The history is written to a cache in a temporary directory.
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import click
+
+from bench_e2e import ROOT, BUSINESS_ID, ACCOUNT_ID, synthetic_data
+
+BY = ('client', 'project')
+
+
+class Source(object):
+    def __init__(self, **info):
+        self.info = info
+
+
+def populate(data, batch_size):
+    from freshtools.cache import initialize
+    from freshtools.models import Account, Business, Client, Project, Task, TimeEntry, TimeEntryDay
+
+    initialize()
+
+    account = Source(id=ACCOUNT_ID)
+    business = Source(id=BUSINESS_ID, account_id=ACCOUNT_ID, name='Benchmark')
+
+    Account.upsert([{'id': ACCOUNT_ID}])
+    Business.upsert([Business.pull_record(None, business.info)])
+    Client.upsert([Client.pull_record(account, client) for client in data['clients']])
+    Task.upsert([Task.pull_record(account, task) for task in data['tasks']])
+    Project.upsert([Project.pull_record(business, project) for project in data['projects']])
+
+    entries = data['time_entries']
+    for start in range(0, len(entries), batch_size):
+        TimeEntry.upsert([TimeEntry.pull_record(business, entry)
+                          for entry in entries[start:start + batch_size]])
+
+    TimeEntryDay.refresh()
+
+
+def timed(f):
+    started = time.time()
+    result = f()
+    return time.time() - started, result
+
+
+def sql_totals(summary, use_rollup):
+    report = summary()
+    report.use_rollup = use_rollup
+
+    return set((str(record[0]), record[1], record[3], round(record[5], 6))
+               for record in report.records())
+
+
+def engine_totals(frame, period):
+    return set((str(row[0]), row[1], row[2], round(row[3] / 3600.0, 6))
+               for row in frame.rows(by=(period,) + BY))
+
+
+@click.command()
+@click.option('--entries', default=200000, help='Number of synthetic time entries')
+@click.option('--batch-size', default=5000, help='Entries written at a time')
+def main(entries, batch_size):
+    sys.path.insert(0, ROOT)
+
+    workspace = tempfile.mkdtemp(prefix='fresh-analytics-')
+    cwd = os.getcwd()
+    os.chdir(workspace)
+
+    try:
+        from freshtools.analytics import TimeEntryFrame
+        from freshtools.entries import time_entry_window
+        from freshtools.summary import WeeksByClientProject, MonthsByClientProject, YearsByClientProject
+
+        seconds, _ = timed(lambda: populate(synthetic_data(entries), batch_size))
+        click.echo('%s time entries, written in %0.1fs' % (entries, seconds))
+
+        seconds, frame = timed(TimeEntryFrame.load)
+        click.echo('  %-10s load %25s %9.1f ms' % ('engine', '', seconds * 1000))
+
+        for period, summary in (('week', WeeksByClientProject),
+                                ('month', MonthsByClientProject),
+                                ('year', YearsByClientProject)):
+            report = lambda: summary(time_entry_window())
+
+            raw_seconds, raw = timed(lambda: sql_totals(report, False))
+            rollup_seconds, rolled_up = timed(lambda: sql_totals(report, True))
+            engine_seconds, vectorized = timed(lambda: engine_totals(frame, period))
+
+            assert raw == rolled_up == vectorized, 'Totals differ by %s' % period
+
+            click.echo('  %-10s %d groups' % (period, len(raw)))
+            click.echo('    sqlite raw      %9.1f ms' % (raw_seconds * 1000))
+            click.echo('    sqlite rollup   %9.1f ms' % (rollup_seconds * 1000))
+            click.echo('    engine          %9.1f ms  (%0.1fx raw, %0.1fx rollup)' % (
+                engine_seconds * 1000,
+                raw_seconds / engine_seconds,
+                rollup_seconds / engine_seconds))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workspace)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Compares the per-entry cost of deriving TimeEntry's date columns with
+date_bucket_columns, against converting and bucketing each timestamp
+separately through dateutil, the way pulls used to.
+
+    python benchmarks/bench_date.py -n 20000
+"""
+
+import os
+import sys
+import time
+import datetime
+import click
+from dateutil import tz
+from dateutil.parser import parse as dateutil_parse_date
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from freshtools.date import (date_bucket_columns, week_ending_datetime,
+                             month_ending_datetime, year_ending_datetime)
+
+
+def separate_columns(created_at, started_at):
+    columns = {}
+
+    for name, timestamp in (('created_at', created_at), ('started_at', started_at)):
+        local = dateutil_parse_date(timestamp).astimezone(tz.tzlocal())
+        date = local.date()
+
+        columns[name] = local
+        columns[name + '_date'] = date
+        columns[name + '_week_ending_date'] = week_ending_datetime(date).date()
+        columns[name + '_month_ending_date'] = month_ending_datetime(date).date()
+        columns[name + '_year_ending_date'] = year_ending_datetime(date).date()
+
+    return columns
+
+
+def bucketed_columns(created_at, started_at):
+    return date_bucket_columns(created_at=created_at, started_at=started_at)
+
+
+def timestamps(count):
+    # Roughly what several years of history looks like: a few entries a day
+    start = datetime.datetime(2014, 1, 1, 9, 0)
+
+    for i in range(count):
+        started_at = start + datetime.timedelta(hours=i * 7)
+        created_at = started_at + datetime.timedelta(hours=1, seconds=i % 60)
+        yield (created_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+               started_at.strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+
+def per_entry(columns, entries):
+    started = time.time()
+
+    for created_at, started_at in entries:
+        columns(created_at, started_at)
+
+    return (time.time() - started) / len(entries)
+
+
+@click.command()
+@click.option('-n', '--entries', default=20000, help='Number of time entries')
+def main(entries):
+    entries = list(timestamps(entries))
+
+    for created_at, started_at in entries[:1000]:
+        assert (separate_columns(created_at, started_at) ==
+                bucketed_columns(created_at, started_at))
+
+    before = per_entry(separate_columns, entries)
+    after = per_entry(bucketed_columns, entries)
+
+    click.echo('%s entries' % len(entries))
+    click.echo('  separately:          %6.1f us/entry' % (before * 1e6))
+    click.echo('  date_bucket_columns: %6.1f us/entry' % (after * 1e6))
+    click.echo('  speedup:             %6.1fx' % (before / after))
+
+
+if __name__ == '__main__':
+    main()
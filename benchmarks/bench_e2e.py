@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+Times `fresh pull`, every `summarize` command, `log day` and `log pending`
+end to end, against a local fake Freshbooks server serving synthetic data.
+
+    python benchmarks/bench_e2e.py --entries 100000 --record results.jsonl
+    python benchmarks/bench_e2e.py --entries 100000 --compare results.jsonl
+
+Each run starts from a freshly initialized cache in an empty directory.
+--record appends the timings to a JSON lines file, and --compare reports
+the change against the last recorded run with the same number of entries.
+"""
+
+import os
+import sys
+import imp
+import json
+import time
+import shutil
+import datetime
+import tempfile
+import subprocess
+import click
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+FRESH = os.path.join(ROOT, 'fresh')
+
+BUSINESS_ID = 1
+ACCOUNT_ID = 'abc'
+DESTINATION = 'bench'
+
+
+class SyntheticTimeEntries(object):
+    """
+    A sequence of `count` time entries that are made up on demand, so the
+    server can page through millions of them without holding them all.
+    The entries are spread evenly over `days` days of history, and over
+    the clients, projects and tasks.
+    """
+    start = datetime.datetime(2014, 1, 1, 9, 0)
+
+    def __init__(self, count, clients, projects, tasks, days=5 * 365):
+        self.count = count
+        self.days = days
+        self.clients = clients
+        self.projects = projects
+        self.tasks = tasks
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.entry(i) for i in range(*index.indices(self.count))]
+
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+
+        return self.entry(index)
+
+    def entry(self, i):
+        project = self.projects[i % len(self.projects)]
+        started_at = self.start + datetime.timedelta(
+            days=i * self.days // self.count, minutes=i % 600)
+        created_at = started_at + datetime.timedelta(hours=1)
+
+        return {
+            'id': i + 1,
+            'client_id': project['client_id'],
+            'project_id': project['id'],
+            'task_id': self.tasks[i % len(self.tasks)]['id'],
+            'created_at': created_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'started_at': started_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'duration': 900 * (1 + i % 16),
+            'billed': i % 3 == 0,
+            'billable': i % 5 != 0,
+            'note': 'Entry %s' % (i + 1),
+        }
+
+
+def synthetic_data(entries, clients=20, projects_per_client=5, tasks=30):
+    clients = [{
+        'id': 1000 + c,
+        'fname': 'First%s' % c,
+        'lname': 'Last%s' % c,
+        'organization': 'Client %s' % c,
+        'email': 'client%s@example.com' % c,
+    } for c in range(clients)]
+
+    projects = [{
+        'id': 2000 + len(clients) * p + c,
+        'client_id': client['id'],
+        'title': 'Project %s %s' % (c, p),
+        'project_type': 'hourly_rate',
+        'rate': 100.0,
+        'fixed_price': None,
+    } for p in range(projects_per_client) for c, client in enumerate(clients)]
+
+    tasks = [{
+        'id': 3000 + t,
+        'name': 'Task %s' % t,
+        'description': '',
+    } for t in range(tasks)]
+
+    return {
+        'clients': clients,
+        'projects': projects,
+        'tasks': tasks,
+        'time_entries': SyntheticTimeEntries(entries, clients, projects, tasks),
+    }
+
+
+def serve(data):
+    from refresh2.api import Urls
+    from refresh2.testing import FakeFreshbooks
+
+    server = FakeFreshbooks()
+    server.add_business(BUSINESS_ID, ACCOUNT_ID, 'Benchmark')
+    server.add_records(Urls.CLIENTS, 'clients', data['clients'], ACCOUNT_ID=ACCOUNT_ID)
+    server.add_records(Urls.TASKS, 'tasks', data['tasks'], ACCOUNT_ID=ACCOUNT_ID)
+    server.add_records(Urls.PROJECTS, 'projects', data['projects'], BUSINESS_ID=BUSINESS_ID)
+    server.add_records(Urls.TIME_ENTRIES, 'time_entries', data['time_entries'],
+                       BUSINESS_ID=BUSINESS_ID)
+
+    return server.start()
+
+
+def load_fresh(server):
+    fresh = imp.load_source('fresh_cli', FRESH)
+
+    # Talk to the fake server instead of going through OAuth
+    def connect(**options):
+        from refresh2.api import Api
+        return Api(server.session(), **options)
+
+    fresh.connect = connect
+    return fresh
+
+
+def summarize_commands(fresh):
+    return [['summarize', name] for name in sorted(fresh.summarize.commands)]
+
+
+def run(fresh, args):
+    with open(os.devnull, 'w') as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+
+        try:
+            started = time.time()
+            fresh.cli.main(args, prog_name='fresh', standalone_mode=False)
+            return time.time() - started
+        finally:
+            sys.stdout = stdout
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def last_recorded(filename, entries):
+    last = None
+
+    if not os.path.exists(filename):
+        return None
+
+    with open(filename) as results:
+        for line in results:
+            result = json.loads(line)
+            if result['entries'] == entries:
+                last = result
+
+    return last
+
+
+@click.command()
+@click.option('--entries', default=10000, help='Number of synthetic time entries')
+@click.option('--page-size', default=100, help='Records per page served')
+@click.option('--concurrency', default=4, help='Pages to fetch at once')
+@click.option('--record', type=click.Path(), default=None,
+              help='Append the timings to this JSON lines file')
+@click.option('--compare', type=click.Path(), default=None,
+              help='Compare against the last run recorded in this file')
+def main(entries, page_size, concurrency, record, compare):
+    sys.path.insert(0, ROOT)
+
+    workspace = tempfile.mkdtemp(prefix='fresh-bench-')
+    cwd = os.getcwd()
+    server = serve(synthetic_data(entries))
+
+    if record:
+        record = os.path.abspath(record)
+    if compare:
+        compare = os.path.abspath(compare)
+
+    # The cache lives in the current directory, and is opened on import
+    os.chdir(workspace)
+
+    try:
+        fresh = load_fresh(server)
+        fresh.freshtools.cache.initialize()
+
+        commands = [
+            ['pull', '--page-size', str(page_size), '--concurrency', str(concurrency)],
+        ] + summarize_commands(fresh) + [
+            ['log', 'destination', 'add', DESTINATION],
+            ['log', 'pending', '--to', DESTINATION],
+            ['log', 'day', '--to', DESTINATION],
+            ['log', 'pending', '--to', DESTINATION],
+        ]
+
+        timings = []
+        for args in commands:
+            timings.append((' '.join(args), run(fresh, args)))
+    finally:
+        os.chdir(cwd)
+        server.stop()
+        shutil.rmtree(workspace)
+
+    previous = last_recorded(compare, entries) if compare else None
+    baseline = dict(previous['timings']) if previous else {}
+
+    click.echo('%s time entries, %s requests' % (entries, len(server.requests)))
+    for name, seconds in timings:
+        line = '  %-45s %9.1f ms' % (name, seconds * 1000)
+
+        if baseline.get(name):
+            line += '  %+6.1f%%' % ((seconds / baseline[name] - 1) * 100)
+
+        click.echo(line)
+
+    if record:
+        with open(record, 'a') as results:
+            results.write(json.dumps({
+                'entries': entries,
+                'page_size': page_size,
+                'concurrency': concurrency,
+                'revision': git_revision(),
+                'recorded_at': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'timings': timings,
+            }) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Measures how long `fresh` takes to start, run a command and exit, the way
+a cron job or shell prompt would run it.
+
+    python benchmarks/startup.py -n 20 summarize today
+
+Run it from the directory holding your .freshtools.db.
+"""
+
+import os
+import sys
+import time
+import subprocess
+import click
+
+FRESH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'fresh')
+
+# Modules that only commands talking to Freshbooks should need
+NETWORK_MODULES = ['flask', 'requests', 'requests_oauthlib', 'oauthlib', 'settings']
+
+IMPORT_PROBE = """
+import os, sys, runpy
+sys.argv = [%(fresh)r] + %(args)r
+sys.path.insert(0, os.path.dirname(%(fresh)r))
+try:
+    runpy.run_path(%(fresh)r, run_name='__main__')
+except SystemExit:
+    pass
+sys.stderr.write(' '.join(m for m in %(modules)r if m in sys.modules))
+"""
+
+
+def run_once(args):
+    with open(os.devnull, 'w') as devnull:
+        started = time.time()
+        subprocess.check_call([sys.executable, FRESH] + args, stdout=devnull)
+        return time.time() - started
+
+
+def imported_network_modules(args):
+    probe = IMPORT_PROBE % {
+        'fresh': FRESH,
+        'args': args,
+        'modules': NETWORK_MODULES,
+    }
+
+    with open(os.devnull, 'w') as devnull:
+        process = subprocess.Popen(
+            [sys.executable, '-c', probe], stdout=devnull, stderr=subprocess.PIPE)
+        _, err = process.communicate()
+
+    return err.split()
+
+
+@click.command(context_settings={'ignore_unknown_options': True})
+@click.option('-n', '--runs', default=10, help='Number of timed runs')
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def main(runs, args):
+    args = list(args) or ['summarize', 'today']
+
+    # The first run warms the OS file cache, and is not counted
+    run_once(args)
+    timings = sorted(run_once(args) for _ in range(runs))
+
+    click.echo('fresh %s (%s runs)' % (' '.join(args), runs))
+    click.echo('  min:    %6.1f ms' % (timings[0] * 1000))
+    click.echo('  median: %6.1f ms' % (timings[len(timings) // 2] * 1000))
+    click.echo('  max:    %6.1f ms' % (timings[-1] * 1000))
+
+    network = imported_network_modules(args)
+    if network:
+        click.echo('  imports network modules: %s' % ', '.join(network))
+
+
+if __name__ == '__main__':
+    main()
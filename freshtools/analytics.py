@@ -0,0 +1,198 @@
+"""
+An in-memory, NumPy backed engine for ad hoc reports over TimeEntry.
+
+    frame = TimeEntryFrame.load()
+    totals = frame.summarize(by=('week', 'client'), start_date=start, client=10)
+
+NumPy is optional; it is only needed by the commands that use this engine.
+"""
+import datetime
+from exceptions import ImproperlyConfiguredException
+from models import db, TimeEntry
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EPOCH = datetime.date(1970, 1, 1)
+
+# Rows fetched from sqlite at a time while loading
+FETCH_SIZE = 10000
+
+# Missing projects and tasks are -1
+NONE_ID = -1
+
+PERIODS = {
+    'day': 'started_at_date',
+    'week': 'started_at_week_ending_date',
+    'month': 'started_at_month_ending_date',
+    'year': 'started_at_year_ending_date',
+}
+
+DIMENSIONS = ('client', 'project', 'task')
+
+# Columns that summarize() totals up
+MEASURES = ('duration', 'billed', 'billable', 'started_at')
+
+COLUMNS = [
+    # (name, dtype, sql)
+    ('id', 'i8', 'id'),
+    ('client', 'i8', 'client_id'),
+    ('project', 'i8', 'IFNULL(project_id, %s)' % NONE_ID),
+    ('task', 'i8', 'IFNULL(task_id, %s)' % NONE_ID),
+    ('started_at', 'i8', "CAST(strftime('%s', started_at) AS INTEGER)"),
+    ('duration', 'i8', 'duration'),
+    ('billed', '?', 'billed'),
+    ('billable', '?', 'billable'),
+] + [
+    # Periods are kept as the day number of the date they end on
+    (period, 'i4', 'CAST(julianday(%s) - 2440587.5 AS INTEGER)' % column)
+    for period, column in sorted(PERIODS.items())
+]
+
+
+def day_number(date):
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+
+    return (date - EPOCH).days
+
+
+def from_day_number(day):
+    return EPOCH + datetime.timedelta(days=int(day))
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImproperlyConfiguredException(
+            'The analytics engine needs numpy: pip install numpy')
+
+
+class TimeEntryFrame(object):
+    """
+    Every TimeEntry as typed column arrays, one array per column in
+    COLUMNS, so reports can be computed with vectorized operations.
+    """
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def load(cls, database=None):
+        _require_numpy()
+
+        dtype = numpy.dtype([(name, kind) for name, kind, _ in COLUMNS])
+        sql = 'SELECT %s FROM %s' % (
+            ', '.join(expression for _, _, expression in COLUMNS),
+            TimeEntry._meta.db_table)
+
+        cursor = (database or db()).execute_sql(sql)
+
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            chunks.append(numpy.fromiter(rows, dtype=dtype, count=len(rows)))
+
+        entries = numpy.concatenate(chunks) if chunks else numpy.empty(0, dtype)
+
+        return cls(dict((name, numpy.ascontiguousarray(entries[name]))
+                        for name, _, _ in COLUMNS))
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def column(self, name):
+        return self.columns[name]
+
+    def mask(self, start_date=None, end_date=None, client=None, project=None,
+             task=None, billed=None, billable=None):
+        """
+        Selects the entries started on or between the given dates, and
+        matching the given ids (one, or a list of them) and flags.
+        """
+        selected = numpy.ones(len(self), dtype=bool)
+        days = self.columns['day']
+
+        if start_date is not None:
+            selected &= days >= day_number(start_date)
+        if end_date is not None:
+            selected &= days <= day_number(end_date)
+
+        for name, ids in (('client', client), ('project', project), ('task', task)):
+            if ids is None:
+                continue
+
+            if isinstance(ids, (list, tuple, set)):
+                selected &= numpy.in1d(self.columns[name], list(ids))
+            else:
+                selected &= self.columns[name] == getattr(ids, 'id', ids)
+
+        for name, flag in (('billed', billed), ('billable', billable)):
+            if flag is not None:
+                selected &= self.columns[name] == flag
+
+        return selected
+
+    def summarize(self, by=('week', 'client', 'project'), **filters):
+        """
+        Totals entries grouped by any of the periods in PERIODS and the
+        dimensions in DIMENSIONS, in that order.  Returns a dict of arrays:
+        one per grouping key, plus duration, billed_duration,
+        billable_duration, entries and the first and last started_at,
+        sorted by the keys.
+        """
+        for key in by:
+            if key not in PERIODS and key not in DIMENSIONS:
+                raise ImproperlyConfiguredException('Cannot group by: %s' % key)
+
+        selected = numpy.flatnonzero(self.mask(**filters))
+        count = len(selected)
+
+        if count == 0 or not by:
+            starts = numpy.zeros(min(1, count), dtype=numpy.intp)
+        else:
+            # Sort by the keys, and cut where any of them changes
+            selected = selected[numpy.lexsort(
+                [self.columns[key][selected] for key in reversed(by)])]
+            changed = numpy.zeros(count, dtype=bool)
+            changed[0] = True
+
+            for key in by:
+                values = self.columns[key][selected]
+                changed[1:] |= values[1:] != values[:-1]
+
+            starts = numpy.flatnonzero(changed)
+
+        entries = dict((name, self.columns[name][selected])
+                       for name in set(by) | set(MEASURES))
+        duration = entries['duration']
+
+        totals = dict((key, entries[key][starts]) for key in by)
+        totals['duration'] = _reduce(numpy.add, duration, starts)
+        totals['billed_duration'] = _reduce(numpy.add, duration * entries['billed'], starts)
+        totals['billable_duration'] = _reduce(numpy.add, duration * entries['billable'], starts)
+        totals['first_started_at'] = _reduce(numpy.minimum, entries['started_at'], starts)
+        totals['last_started_at'] = _reduce(numpy.maximum, entries['started_at'], starts)
+        totals['entries'] = numpy.diff(numpy.append(starts, count))
+
+        return totals
+
+    def rows(self, by=('week', 'client', 'project'), **filters):
+        """ summarize() as tuples of the keys, in order, then the duration """
+        totals = self.summarize(by=by, **filters)
+        columns = [totals[key] for key in by] + [totals['duration']]
+
+        for values in zip(*columns):
+            row = [from_day_number(value) if key in PERIODS else int(value)
+                   for key, value in zip(by, values)]
+            yield tuple(row) + (int(values[-1]),)
+
+
+def _reduce(ufunc, values, starts):
+    if len(starts) == 0:
+        return numpy.zeros(0, dtype=values.dtype)
+
+    return ufunc.reduceat(values, starts)
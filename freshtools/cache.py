@@ -1,11 +1,25 @@
+import sys
+import time
+import Queue
+import datetime
+import collections
+import threading
 from peewee import DoesNotExist
 from console import get_logger
-from models import ALL_MODELS, db, MetaData
-from util import model_dependency_order, create_tables, drop_tables
+from models import ALL_MODELS, BATCH_SIZE, db, MetaData, PullDigest
+from profiling import phase
+from util import model_dependency_order, model_dependency_levels, create_tables, drop_tables
 
 
 logger = get_logger()
 
+# Number of fetched batches allowed to wait for the writer
+PENDING_BATCHES = 8
+
+# Number of written batches committed at once, so readers never see more
+# than this much of a pull missing, and the WAL can be checkpointed
+COMMIT_BATCHES = 20
+
 
 def exists():
     return MetaData.table_exists()
@@ -22,6 +36,12 @@ def initialize():
 def status():
     for model in ALL_MODELS:
 
+        # Caches made before a model was added only get its table on the
+        # next pull, and reports can't create it
+        if not model.table_exists():
+            logger.info('%s: not created yet, pull to create it' % model.__name__)
+            continue
+
         last_pulled = MetaData.get_last_pulled_time(model)
 
         info = '%s' % model.select().wrapped_count()
@@ -36,6 +56,9 @@ def show(models):
     print_func = lambda s: logger.info(' ' * indent + s)
 
     for model in models:
+        if not model.table_exists():
+            continue
+
         logger.info('%ss' % model.__name__)
 
         for row in model.select():
@@ -46,17 +69,189 @@ def show(models):
                 pass
 
 
-def pull(api, models):
-    dep_order = model_dependency_order(models)
+def _put(pending, item, cancelled):
+    """ Returns False if the writer gave up before taking the item """
+    while not cancelled.is_set():
+        try:
+            pending.put(item, timeout=0.1)
+            return True
+        except Queue.Full:
+            pass
+
+    return False
+
+
+def _get(pending):
+    # Blocking on a queue without a timeout ignores Ctrl-C on Python 2
+    while True:
+        try:
+            return pending.get(timeout=0.1)
+        except Queue.Empty:
+            pass
+
+
+def _fetch(model, api, full, batch_size, window, pending, cancelled):
+    """
+    Runs in its own thread, downloading and mapping batches of a model
+    for the writer.  Time spent waiting on the writer is not counted.
+    """
+    batches = None
+
+    try:
+        fetching = 0.0
+        started = time.time()
+
+        batches = model.pull_batches(
+            api, full=full, batch_size=batch_size, window=window)
+
+        for batch in batches:
+            fetching += time.time() - started
+            if not _put(pending, ('batch', model, batch), cancelled):
+                return
+            started = time.time()
+
+        fetching += time.time() - started
+        _put(pending, ('done', model, fetching), cancelled)
+    except Exception:
+        _put(pending, ('error', model, sys.exc_info()), cancelled)
+    finally:
+        # Stops any pages still being downloaded
+        if batches is not None:
+            batches.close()
+
+        if not db().is_closed():
+            db().close()
+
+
+def _pull_level(api, models, full, batch_size, window, timings, changes):
+    """
+    Fetches every model of a dependency level at once, while writing what
+    comes back from this thread only, so there is a single writer.
+    """
+    pending = Queue.Queue(PENDING_BATCHES)
+    cancelled = threading.Event()
+    started_at = datetime.datetime.utcnow()
+
+    fetchers = []
+    for model in models:
+        logger.info('Caching: %s' % model.__name__)
+        model.pull_started()
+
+        fetcher = threading.Thread(
+            target=_fetch,
+            args=(model, api, full, batch_size, window, pending, cancelled))
+        fetcher.daemon = True
+        fetcher.start()
+        fetchers.append(fetcher)
+
+    try:
+        # Taking the write lock up front means waiting for it, rather than
+        # failing to upgrade a read lock halfway through
+        with db().transaction('IMMEDIATE') as transaction:
+            remaining = len(models)
+            uncommitted = 0
+
+            # Called once what was written so far is committed, like the
+            # stores of http validators
+            on_commit = []
+
+            def commit():
+                for model in models:
+                    model.pull_committing()
 
-    for model in dep_order:
+                transaction.commit()
+
+                for callback in on_commit:
+                    callback()
+                del on_commit[:]
+
+            while remaining > 0:
+                kind, model, value = _get(pending)
+
+                if kind == 'batch':
+                    started = time.time()
+                    with phase('upsert', rows=len(value)):
+                        changes[model].update(model.write_batch(value))
+                    changes[model]['unchanged'] += value.unchanged
+                    timings[model] += time.time() - started
+
+                    on_commit.extend(value.on_commit)
+
+                    uncommitted += 1
+                    if uncommitted >= COMMIT_BATCHES:
+                        commit()
+                        uncommitted = 0
+
+                elif kind == 'done':
+                    timings[model] += value
+                    remaining -= 1
+
+                    model.pull_finished(api, started_at, window=window)
+
+                    # A windowed pull only saw some of the model's records
+                    if window is None:
+                        MetaData.update_last_pulled_time(model)
+
+                    commit()
+                    uncommitted = 0
+
+                    logger.info('   %s inserted: %s, updated: %s, unchanged: %s, records: %s' % (
+                        model.__name__, changes[model]['inserted'], changes[model]['updated'],
+                        changes[model]['unchanged'], model.select().count()))
+
+                else:
+                    raise value[0], value[1], value[2]
+    finally:
+        cancelled.set()
+
+        for fetcher in fetchers:
+            fetcher.join()
+
+
+def pull(api, models, full=False, batch_size=BATCH_SIZE, window=None):
+    started = time.time()
+    timings = {}
+    changes = {}
+
+    # Every model's pull keeps its digests there
+    if not PullDigest.table_exists():
+        create_tables([PullDigest])
+
+    for level in model_dependency_levels(models):
         with db().atomic():
-            if not model.table_exists():
-                create_tables([model])
+            create_tables([model for model in level if not model.table_exists()])
+
+        pullable = [model for model in level if hasattr(model, 'pull')]
+        if not pullable:
+            continue
+
+        for model in pullable:
+            timings[model] = 0.0
+            changes[model] = collections.Counter(inserted=0, updated=0, unchanged=0)
+
+        _pull_level(api, pullable, full, batch_size, window, timings, changes)
+
+    elapsed = time.time() - started
+    serial = sum(timings.values())
+
+    logger.info('Pulled in %0.2fs, %0.2fs one model at a time (saved %0.2fs)' % (
+        elapsed, serial, max(0.0, serial - elapsed)))
+    totals = sum(changes.values(), collections.Counter())
+    logger.info('Inserted %s rows, updated %s, %s unchanged' % (
+        totals['inserted'], totals['updated'], totals['unchanged']))
+    logger.debug('Api cache: %(hits)s hits, %(misses)s misses, %(shared)s shared' %
+                 api.cache_stats())
 
-            if hasattr(model, 'pull'):
-                logger.info('Caching: %s' % model.__name__)
-                model.pull(api)
-                logger.info('   Records: %s' % model.select().count())
+    counted = lambda kind: dict(
+        (model.__name__, counts[kind]) for model, counts in changes.items())
 
-                MetaData.update_last_pulled_time(model)
\ No newline at end of file
+    return {
+        'elapsed': elapsed,
+        'serial': serial,
+        'models': dict((model.__name__, timing) for model, timing in timings.items()),
+        'inserted': counted('inserted'),
+        'updated': counted('updated'),
+        'unchanged': counted('unchanged'),
+        'changed': dict((model.__name__, counts['inserted'] + counts['updated'])
+                        for model, counts in changes.items()),
+    }
@@ -1,3 +1,4 @@
+import re
 import click
 from date import parse_datetime
 
@@ -23,6 +24,22 @@ class DateTimeParameter(ParsedParameter):
         super(DateTimeParameter, self).__init__(parse_datetime)
 
 
+def parse_pragma(value):
+    """ Parses NAME=VALUE into a (name, value) sqlite pragma """
+    match = re.match(r'^\s*(\w+)\s*=\s*([\w.+-]+)\s*$', value)
+    if match is None:
+        raise ValueError('Expected a pragma as NAME=VALUE: %s' % value)
+
+    return match.group(1), match.group(2)
+
+
+class PragmaParameter(ParsedParameter):
+    name = 'pragma'
+
+    def __init__(self):
+        super(PragmaParameter, self).__init__(parse_pragma)
+
+
 class AliasedGroup(click.Group): 
     """
     https://github.com/click-contrib/click-aliases
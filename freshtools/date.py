@@ -1,8 +1,42 @@
+import re
+import calendar
 import datetime
 from dateutil import tz
 from dateutil.parser import parse as dateutil_parse_date
 from dateutil.relativedelta import relativedelta
 
+LOCAL_TIMEZONE = tz.tzlocal()
+UTC_TIMEZONE = tz.tzutc()
+
+# What the API sends: 2018-02-14T15:00:00Z, optionally with fractional
+# seconds or a numeric offset.  Anything else goes through dateutil.
+ISO_8601_DATETIME = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.(\d{1,6})\d*)?'
+    r'(Z|[+-]\d\d:?\d\d)?$')
+
+
+def parse_iso8601_datetime(date):
+    match = ISO_8601_DATETIME.match(date)
+    if match is None:
+        return None
+
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+
+    if offset is None:
+        tzinfo = None
+    elif offset == 'Z':
+        tzinfo = UTC_TIMEZONE
+    else:
+        minutes = int(offset[1:3]) * 60 + int(offset[-2:])
+        if offset[0] == '-':
+            minutes = -minutes
+        tzinfo = tz.tzoffset(None, minutes * 60)
+
+    return datetime.datetime(
+        int(year), int(month), int(day), int(hour), int(minute), int(second),
+        int(fraction.ljust(6, '0')) if fraction else 0, tzinfo)
+
+
 def parse_datetime(date):
     if type(date) is datetime.date:
         return datetime.datetime.combine(date, datetime.datetime.min.time())
@@ -10,15 +44,68 @@ def parse_datetime(date):
     if type(date) is datetime.datetime:
         return date
 
+    parsed = parse_iso8601_datetime(date)
+    if parsed is not None:
+        return parsed
+
     return dateutil_parse_date(date)
 
 
 def local_from_utc_datetime(date):
     date = parse_datetime(date)
-    local = date.astimezone(tz.tzlocal())
+    local = date.astimezone(LOCAL_TIMEZONE)
     return local
 
 
+def utc_from_local_datetime(date):
+    """ Converts a naive local datetime to a naive UTC one """
+    date = parse_datetime(date)
+    utc = date.replace(tzinfo=LOCAL_TIMEZONE).astimezone(UTC_TIMEZONE)
+    return utc.replace(tzinfo=None)
+
+
+# Calendar date -> (week, month, year) ending dates
+_period_ending_dates = {}
+
+
+def period_ending_dates(date):
+    """ The week, month and year ending dates of a calendar date """
+    try:
+        return _period_ending_dates[date]
+    except KeyError:
+        pass
+
+    endings = _period_ending_dates[date] = (
+        date + datetime.timedelta(days=6 - date.weekday()),
+        date.replace(day=calendar.monthrange(date.year, date.month)[1]),
+        date.replace(month=12, day=31),
+    )
+
+    return endings
+
+
+def date_bucket_columns(**timestamps):
+    """
+    Converts each UTC timestamp to local time, and buckets it by day, week,
+    month and year, in one go.  For created_at=... this returns created_at,
+    created_at_date and created_at_{week,month,year}_ending_date.
+    """
+    columns = {}
+
+    for name, timestamp in timestamps.items():
+        local = local_from_utc_datetime(timestamp)
+        date = local.date()
+        week, month, year = period_ending_dates(date)
+
+        columns[name] = local
+        columns[name + '_date'] = date
+        columns[name + '_week_ending_date'] = week
+        columns[name + '_month_ending_date'] = month
+        columns[name + '_year_ending_date'] = year
+
+    return columns
+
+
 def beginning_of_day(date):
     date = parse_datetime(date)
     return datetime.datetime.combine(date.date(), datetime.datetime.min.time())
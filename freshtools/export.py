@@ -0,0 +1,71 @@
+import sys
+import csv
+import json
+import datetime
+import contextlib
+import collections
+
+FORMATS = ('text', 'csv', 'jsonl')
+
+# Reports are written out in blocks of this many bytes
+BUFFER_SIZE = 64 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+def _encoded(record):
+    return [value.encode('utf8') if isinstance(value, unicode) else value
+            for value in record]
+
+
+def write_text(summary, out):
+    summary.print_report(lambda line: out.write(line + '\n'))
+
+
+def write_csv(summary, out):
+    writer = csv.writer(out)
+    writer.writerow(summary.record_names())
+
+    for record in summary.records():
+        writer.writerow(_encoded(record))
+
+
+def write_jsonl(summary, out):
+    names = summary.record_names()
+
+    for record in summary.records():
+        out.write(json.dumps(
+            collections.OrderedDict(zip(names, record)), default=_json_default))
+        out.write('\n')
+
+
+WRITERS = {
+    'text': write_text,
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+}
+
+
+@contextlib.contextmanager
+def output_stream(output=None):
+    if output is None:
+        yield sys.stdout
+        return
+
+    with open(output, 'wb', BUFFER_SIZE) as out:
+        yield out
+
+
+def export(summary, format='text', output=None):
+    """
+    Streams a summary out in the given format, to the output file or to
+    stdout.  The csv and jsonl formats write one record per report row,
+    as they come back from the database.
+    """
+    with output_stream(output) as out:
+        WRITERS[format](summary, out)
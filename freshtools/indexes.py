@@ -0,0 +1,71 @@
+from models import ALL_MODELS, db
+
+
+class Index(object):
+    def __init__(self, model, fields, unique):
+        self.model = model
+        self.fields = [
+            model._meta.fields[field] if isinstance(field, basestring) else field
+            for field in fields]
+        self.unique = unique
+
+    @property
+    def name(self):
+        return db().compiler().index_name(
+            self.model._meta.db_table, [field.db_column for field in self.fields])
+
+    def exists(self):
+        return self.name in existing_index_names(self.model)
+
+    def create(self):
+        db().create_index(self.model, self.fields, self.unique)
+
+    def drop(self):
+        db().drop_index(self.model, self.fields, safe=True)
+
+    def __repr__(self):
+        return '%s%s (%s)' % (
+            'UNIQUE ' if self.unique else '',
+            self.name,
+            ', '.join(field.name for field in self.fields))
+
+
+def declared_indexes(models=ALL_MODELS):
+    """ Every index the schema asks for, including foreign key indexes. """
+    for model in models:
+        for fields, unique in model._index_data():
+            yield Index(model, fields, unique)
+
+
+def existing_index_names(model):
+    if not model.table_exists():
+        return set()
+
+    return set(index.name for index in db().get_indexes(model._meta.db_table))
+
+
+def show_indexes(print_func, models=ALL_MODELS):
+    for index in declared_indexes(models):
+        print_func('%-8s %s' % ('ok' if index.exists() else 'missing', index))
+
+
+def create_indexes(print_func, models=ALL_MODELS):
+    with db().atomic():
+        for index in declared_indexes(models):
+            if index.model.table_exists() and not index.exists():
+                print_func('Creating %s' % index)
+                index.create()
+
+
+def drop_indexes(print_func, models=ALL_MODELS):
+    # Unique indexes enforce constraints, rather than speed up queries
+    with db().atomic():
+        for index in declared_indexes(models):
+            if not index.unique and index.exists():
+                print_func('Dropping %s' % index)
+                index.drop()
+
+
+def explain(query):
+    sql, params = query.sql()
+    return db().execute_sql('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
@@ -1,4 +1,10 @@
-from freshtools.models import LogDestination, TaskLog, TimeEntry
+import datetime
+import operator
+import itertools
+import collections
+from peewee import fn, Param, SQL, JOIN_LEFT_OUTER
+from freshtools.indexes import Index
+from freshtools.models import db, Client, LogDestination, Project, TaskLog, TimeEntry
 
 
 def add_destination(destination):
@@ -16,9 +22,47 @@ def list_destinations(print_func):
         print_func(dest.destination)
 
 
+def unique_task_logs():
+    """
+    Caches from before TaskLog's unique index may have entries logged more
+    than once, which have to go before the index can be created.
+    """
+    index = Index(TaskLog, ('time_entry', 'log_destination'), True)
+    if index.exists():
+        return
+
+    with db().atomic():
+        first_logs = (TaskLog
+                      .select(fn.MIN(TaskLog.id))
+                      .group_by(TaskLog.time_entry, TaskLog.log_destination))
+        TaskLog.delete().where(~(TaskLog.id << first_logs)).execute()
+        index.create()
+
+
 def log_entries(time_entries, destination):
-    for entry in time_entries:
-        TaskLog.create(time_entry=entry, log_destination=destination)
+    """
+    Logs the entries a time_entries() query selects to the destination in
+    one INSERT ... SELECT, skipping those already logged there.  Returns
+    the number of entries newly logged, and the number already logged.
+    """
+    unique_task_logs()
+    now = datetime.datetime.now()
+
+    logs = time_entries.select(
+        TimeEntry.id, Param(destination.id), Param(now), Param(now.date()))
+
+    insert = TaskLog.insert_from([
+        TaskLog.time_entry,
+        TaskLog.log_destination,
+        TaskLog.created_at,
+        TaskLog.created_at_date,
+    ], logs).on_conflict('IGNORE')
+
+    with db().atomic():
+        selected = time_entries.count()
+        logged = db().execute_sql(*insert.sql()).rowcount
+
+    return logged, selected - logged
 
 
 def time_entries(client, start_date, end_date):
@@ -39,4 +83,90 @@ def time_entries(client, start_date, end_date):
             TimeEntry.created_at <= end_date
         )
 
-    return qs
\ No newline at end of file
+    return qs
+
+
+def pending_entries(time_entries, destination):
+    """
+    The entries a time_entries() query selects that are not logged to the
+    destination yet, ordered by client and project.  Each is looked up in
+    TaskLog's unique index, so the logs are never read in bulk.
+    """
+    logged = TaskLog.select(SQL('1')).where(
+        (TaskLog.time_entry == TimeEntry.id) &
+        (TaskLog.log_destination == destination)
+    )
+
+    return time_entries.select(
+        TimeEntry.id,
+        TimeEntry.client,
+        TimeEntry.project,
+        TimeEntry.started_at,
+        TimeEntry.duration,
+        TimeEntry.note,
+        Client.organization,
+        Project.title,
+    ).join(
+        Client
+    ).switch(
+        TimeEntry
+    ).join(
+        Project, JOIN_LEFT_OUTER
+    ).where(
+        ~fn.EXISTS(logged)
+    ).order_by(
+        TimeEntry.client,
+        TimeEntry.project,
+        TimeEntry.started_at,
+    )
+
+
+# The columns pending_entries() selects
+PendingEntry = collections.namedtuple(
+    'PendingEntry', 'id client_id project_id started_at duration note client project')
+
+
+def _totals(counts):
+    return '%s entries, %0.2f hours' % (counts['entries'], counts['duration'] / 3600.0)
+
+
+def print_pending(entries, print_func):
+    """
+    Streams pending entries out under their client and project, with the
+    totals of each.  Returns the number of entries and their duration.
+    """
+    out = lambda line: print_func(line.encode('utf8', 'replace'))
+    totals = collections.Counter()
+
+    # Rows come straight off the cursor, since having peewee build and
+    # convert them costs more than everything else put together
+    entries = itertools.imap(PendingEntry._make, db().execute_sql(*entries.sql()))
+
+    by_client = itertools.groupby(entries, operator.attrgetter('client_id'))
+    for _, client_entries in by_client:
+        client_totals = collections.Counter()
+
+        by_project = itertools.groupby(client_entries, operator.attrgetter('project_id'))
+        for _, project_entries in by_project:
+            project_totals = collections.Counter()
+
+            for entry in project_entries:
+                if not client_totals and not project_totals:
+                    out(u'Client: %s' % entry.client)
+                if not project_totals:
+                    out(u'  Project: %s' % (entry.project or '<NO PROJECT>'))
+
+                out(u'    %s  %s  %0.2f hours  %s' % (
+                    entry.id, entry.started_at, entry.duration / 3600.0, entry.note or ''))
+                project_totals.update(entries=1, duration=entry.duration)
+
+            out(u'    Total: %s' % _totals(project_totals))
+            client_totals.update(project_totals)
+
+        out(u'  Total: %s' % _totals(client_totals))
+        out(u'')
+        totals.update(client_totals)
+
+    out(u'Pending: %s' % _totals(totals))
+
+    return totals['entries'], totals['duration']
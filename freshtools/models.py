@@ -1,14 +1,83 @@
+import json
+import sqlite3
+import hashlib
 import datetime
+import collections
 from peewee import *
 from playhouse.kv import PickledKeyStore
 from refresh2.util import memoize, classproperty, safe_get
 from exceptions import *
-from date import local_from_utc_datetime, week_ending_datetime, month_ending_datetime, year_ending_datetime
+from util import chunked
+from date import date_bucket_columns, utc_from_local_datetime
+from profiling import phase
+
+
+# Number of pulled records buffered before they are written out
+BATCH_SIZE = 500
+
+# Sqlite refuses statements with more bound parameters than this
+# (SQLITE_MAX_VARIABLE_NUMBER for versions before 3.32)
+SQLITE_MAX_VARIABLES = 999
+
+# Sqlite understands INSERT ... ON CONFLICT DO UPDATE from 3.24 on
+SQLITE_UPSERT = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+
+DATABASE_FILE = '.freshtools.db'
+
+# Every connection to the cache is opened with these, in order; `fresh
+# --pragma` adds to or overrides them
+PRAGMAS = [
+    # Readers see the last commit instead of waiting for a pull to finish
+    ('journal_mode', 'wal'),
+    # A crash can lose the last commits but never corrupt the cache, which
+    # the next pull re-fetches anyway
+    ('synchronous', 'normal'),
+    # Negative sizes are in KiB
+    ('cache_size', -16000),
+    ('mmap_size', 256 * 1024 * 1024),
+]
+
+# Seconds to wait for another connection's lock before giving up
+BUSY_TIMEOUT = 10.0
+
+
+class CacheDatabase(SqliteDatabase):
+    """
+    The sqlite database the cache lives in.  Read only connections refuse
+    to write, so reports can never take the lock a pull is waiting for.
+    """
+
+    def __init__(self, database, pragmas=PRAGMAS, busy_timeout=BUSY_TIMEOUT,
+                 read_only=False):
+        super(CacheDatabase, self).__init__(
+            database, pragmas=list(pragmas), timeout=busy_timeout)
+        self.read_only = read_only
+
+    def configure(self, pragmas=(), busy_timeout=None, read_only=None):
+        """ Changes how connections are opened, from the next one on """
+        if not self.is_closed():
+            self.close()
+
+        settings = collections.OrderedDict(self._pragmas)
+        settings.update(pragmas)
+        self._pragmas = settings.items()
+
+        if busy_timeout is not None:
+            self.connect_kwargs['timeout'] = busy_timeout
+        if read_only is not None:
+            self.read_only = read_only
+
+    def _set_pragmas(self, conn):
+        super(CacheDatabase, self)._set_pragmas(conn)
+
+        if self.read_only:
+            conn.execute('PRAGMA query_only = 1')
 
 
 @memoize
 def db():
-    return SqliteDatabase('.freshtools.db')
+    return CacheDatabase(DATABASE_FILE)
 
 
 def get_the_one_or_fail(model, **kwargs):
@@ -44,6 +113,17 @@ class MetaData(object):
         last_pull = safe_get(cls.metadata, 'last_pulled_datetime', {})
         return safe_get(last_pull, model.__name__, None)
 
+    @classmethod
+    def update_sync_watermark(cls, model, key, watermark):
+        watermarks = safe_get(cls.metadata, 'sync_watermarks', {})
+        watermarks.setdefault(model.__name__, {})[key] = watermark
+        cls.metadata['sync_watermarks'] = watermarks
+
+    @classmethod
+    def get_sync_watermark(cls, model, key):
+        watermarks = safe_get(cls.metadata, 'sync_watermarks', {})
+        return safe_get(safe_get(watermarks, model.__name__, {}), key, None)
+
 
 class BaseModel(Model):
     display_fields = []
@@ -54,11 +134,46 @@ class BaseModel(Model):
 
     @classmethod
     def upsert(cls, data):
+        """
+        Inserts rows, and updates the rows already there with the same
+        primary key where any of their columns differ.  Rows that did not
+        change are left alone, rather than deleted and inserted again along
+        with their index entries.  Returns a Counter of the rows inserted,
+        updated and unchanged.
+        """
+        counts = collections.Counter(inserted=0, updated=0, unchanged=0)
+        if len(data) == 0:
+            return counts
+
+        names = list(data[0])
+        fields = [cls._meta.fields[name] for name in names]
+        key_fields = cls._meta.get_primary_key_fields()
+        key_indexes = [names.index(field.name) for field in key_fields]
+
+        # Like INSERT OR REPLACE, the last of several rows with a key wins
+        rows = collections.OrderedDict()
+        for row in data:
+            values = [field.db_value(row[field.name]) for field in fields]
+            rows[tuple(values[i] for i in key_indexes)] = values
+
+        rows_per_insert = max(1, SQLITE_MAX_VARIABLES // len(fields))
+
         with db().atomic():
-            if len(data) > 0:
-                return cls.insert_many(data).on_conflict('REPLACE').execute()
-            else:
-                return 0
+            for chunk in chunked(rows.items(), rows_per_insert):
+                if SQLITE_UPSERT:
+                    existing = len(_existing_keys(cls, key_fields, [key for key, _ in chunk]))
+                    written = _upsert(cls, fields, key_fields, [values for _, values in chunk])
+                    inserted = len(chunk) - existing
+                    updated = written - inserted
+                else:
+                    inserted, updated = _update_then_insert(
+                        cls, fields, key_fields, [values for _, values in chunk])
+
+                counts['inserted'] += inserted
+                counts['updated'] += updated
+                counts['unchanged'] += len(chunk) - inserted - updated
+
+        return counts
 
     def show(self, print_func):
         for field, fmt in self.display_fields:
@@ -72,30 +187,329 @@ class BaseModel(Model):
         database = db()
 
 
-class Account(BaseModel):
+def _quoted(name):
+    return '"%s"' % name
+
+
+def _existing_keys(model, key_fields, keys):
+    """
+    Which of the given primary keys are in the model's table.  Keys are
+    looked up by the values of all their columns but the last, then IN
+    the last one's, which sqlite searches the primary key index for; it
+    scans the whole table for IN over composite row values.
+    """
+    columns = [_quoted(field.db_column) for field in key_fields]
+    existing = []
+
+    by_prefix = collections.OrderedDict()
+    for key in keys:
+        by_prefix.setdefault(key[:-1], []).append(key[-1])
+
+    for prefix, last_values in by_prefix.items():
+        conditions = ['%s = ?' % column for column in columns[:-1]]
+        conditions.append('%s IN (%s)' % (columns[-1], ', '.join('?' * len(last_values))))
+
+        sql = 'SELECT %s FROM %s WHERE %s' % (
+            ', '.join(columns), _quoted(model._meta.db_table), ' AND '.join(conditions))
+        existing.extend(db().execute_sql(sql, list(prefix) + last_values).fetchall())
+
+    return existing
+
+
+def _upsert(model, fields, key_fields, rows):
+    """ One INSERT ... ON CONFLICT DO UPDATE, returning the rows written """
+    columns = [_quoted(field.db_column) for field in fields]
+    keys = set(field.name for field in key_fields)
+    values = [_quoted(field.db_column) for field in fields if field.name not in keys]
+    row = '(%s)' % ', '.join('?' * len(fields))
+
+    sql = 'INSERT INTO %s (%s) VALUES %s ON CONFLICT (%s) ' % (
+        _quoted(model._meta.db_table),
+        ', '.join(columns),
+        ', '.join([row] * len(rows)),
+        ', '.join(_quoted(field.db_column) for field in key_fields))
+
+    if values:
+        sql += 'DO UPDATE SET %s WHERE %s' % (
+            ', '.join('%s = excluded.%s' % (column, column) for column in values),
+            ' OR '.join('%s IS NOT excluded.%s' % (column, column) for column in values))
+    else:
+        sql += 'DO NOTHING'
+
+    return db().execute_sql(sql, [value for values in rows for value in values]).rowcount
+
+
+def _unchanged_keys(model, fields, key_fields, rows):
+    """
+    The primary keys of the given rows that are already stored with the
+    same values, compared the way _upsert() compares them, by searching
+    the primary key index for each row.
+    """
+    keys = set(field.name for field in key_fields)
+    conditions = ['%s %s ?' % (_quoted(field.db_column), '=' if field.name in keys else 'IS')
+                  for field in fields]
+    match = '(%s)' % ' AND '.join(conditions)
+    unchanged = set()
+
+    for chunk in chunked(rows, max(1, SQLITE_MAX_VARIABLES // len(fields))):
+        sql = 'SELECT %s FROM %s WHERE %s' % (
+            ', '.join(_quoted(field.db_column) for field in key_fields),
+            _quoted(model._meta.db_table),
+            ' OR '.join([match] * len(chunk)))
+
+        unchanged.update(db().execute_sql(
+            sql, [value for values in chunk for value in values]).fetchall())
+
+    return unchanged
+
+
+def _update_then_insert(model, fields, key_fields, rows):
+    """
+    What _upsert() does, for sqlite before 3.24: updates the rows that
+    changed one at a time, then inserts the rest.  Returns the number of
+    rows inserted and updated.
+    """
+    table = _quoted(model._meta.db_table)
+    keys = set(field.name for field in key_fields)
+    value_fields = [field for field in fields if field.name not in keys]
+    updated = 0
+
+    if value_fields:
+        sql = 'UPDATE %s SET %s WHERE %s AND (%s)' % (
+            table,
+            ', '.join('%s = ?' % _quoted(field.db_column) for field in value_fields),
+            ' AND '.join('%s = ?' % _quoted(field.db_column) for field in key_fields),
+            ' OR '.join('%s IS NOT ?' % _quoted(field.db_column) for field in value_fields))
+
+        for values in rows:
+            row = dict((field.name, value) for field, value in zip(fields, values))
+            changed = [row[field.name] for field in value_fields]
+            updated += db().execute_sql(
+                sql, changed + [row[field.name] for field in key_fields] + changed).rowcount
+
+    sql = 'INSERT OR IGNORE INTO %s (%s) VALUES %s' % (
+        table,
+        ', '.join(_quoted(field.db_column) for field in fields),
+        ', '.join(['(%s)' % ', '.join('?' * len(fields))] * len(rows)))
+
+    inserted = db().execute_sql(sql, [value for values in rows for value in values]).rowcount
+
+    return inserted, updated
+
+
+class PullDigest(BaseModel):
+    """
+    Digests of the records pulls last wrote, so that what comes back from
+    Freshbooks unchanged is not written again.
+    """
+    model = CharField()
+    key = CharField()
+    digest = CharField()
+
+    class Meta:
+        primary_key = CompositeKey('model', 'key')
+
+    @classmethod
+    def stored(cls, model, keys):
+        """ The stored digests of the given keys, by key """
+        digests = {}
+
+        for chunk in chunked(keys, SQLITE_MAX_VARIABLES - 1):
+            digests.update(cls.select(cls.key, cls.digest).where(
+                (cls.model == model.__name__) & (cls.key << chunk)).tuples())
+
+        return digests
+
+    @classmethod
+    def store(cls, model, digests):
+        cls.upsert([{'model': model.__name__, 'key': key, 'digest': digest}
+                    for key, digest in digests.items()])
+
+
+def content_digest(value):
+    """ A digest of JSON data, that changes whenever the data does """
+    return hashlib.sha1(json.dumps(value, sort_keys=True, separators=(',', ':'))).hexdigest()
+
+
+class PulledBatch(list):
+    """
+    Rows for the writer, along with the digests to store once they are
+    written, the number of records left out since the last batch because
+    they had not changed, and what to call once the batch is committed,
+    like the stores of its pages' http validators.
+    """
+
+    def __init__(self):
+        super(PulledBatch, self).__init__()
+        self.digests = {}
+        self.unchanged = 0
+        self.on_commit = []
+
+
+def source_info(key):
+    """
+    Pull field getter for values that come from the api object a page was
+    fetched from, rather than from the record itself.
+    """
+    return lambda source, record: source.info[key]
+
+
+def window_client_id(window):
+    if window is not None and window.client is not None:
+        return window.client.id
+    else:
+        return None
+
+
+class FreshbooksModel(BaseModel):
+    """
+    A model mirrored from Freshbooks.
+
+    pull_pages() yields (source, page) pairs, where source is the api object
+    the page was fetched from.  Every record in a page is mapped to a row
+    according to pull_fields, a sequence of (field, getter) pairs where the
+    getter is either a key into the record, or a function taking
+    (source, record).  Rows are written out batch_size at a time, so pulling
+    never holds more than one batch in memory.
+
+    A TimeEntryWindow narrows a pull down to what the API can filter on
+    its end, so only the rows needed are transferred.
+
+    Pulls keep a PullDigest of every record they write.  Records that come
+    back with the same digest are skipped before they are even mapped, so
+    pulling a history that did not change writes next to nothing.  Full
+    pulls write everything regardless.
+    """
+    pull_fields = ()
+
+    @classmethod
+    def pull_pages(cls, api, full=False, window=None):
+        return iter(())
+
+    @classmethod
+    def pull_record(cls, source, record):
+        row = {}
+
+        for field, getter in cls.pull_fields:
+            if callable(getter):
+                row[field] = getter(source, record)
+            else:
+                row[field] = record[getter]
+
+        return row
+
+    @classmethod
+    def record_key(cls, record):
+        return 'record:%s' % record['id']
+
+    @classmethod
+    def pull_batches(cls, api, full=False, batch_size=BATCH_SIZE, window=None):
+        # Pages the server says did not change since they were last pulled,
+        # and records with the digest they were last written with, are
+        # already in the cache, unless it was initialized since.
+        skip_unchanged = not full and MetaData.get_last_pulled_time(cls) is not None
+        batch = PulledBatch()
+
+        for source, page in cls.pull_pages(api, full=full, window=window):
+            if skip_unchanged and getattr(page, 'unchanged', False):
+                continue
+
+            # Records are digested along with the source they are mapped with
+            source_id = getattr(source, 'info', {}).get('id')
+            records = [(cls.record_key(record), content_digest([source_id, record]), record)
+                       for record in page]
+
+            stored = {}
+            if skip_unchanged:
+                stored = PullDigest.stored(cls, [key for key, _, _ in records])
+
+            for key, digest, record in records:
+                if stored.get(key) == digest:
+                    batch.unchanged += 1
+                    continue
+
+                batch.append(cls.pull_record(source, record))
+                batch.digests[key] = digest
+
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = PulledBatch()
+
+            # Pages the server sent validators for are only to be asked for
+            # with them once their records are committed
+            store = getattr(page, 'store', None)
+            if store is not None:
+                batch.on_commit.append(store)
+
+        if batch or batch.digests or batch.unchanged or batch.on_commit:
+            yield batch
+
+    @classmethod
+    def write_batch(cls, batch):
+        """ Writes out a pulled batch and its digests, see BaseModel.upsert """
+        counts = cls.upsert(batch)
+        PullDigest.store(cls, batch.digests)
+
+        return counts
+
+    @classmethod
+    def pull_started(cls):
+        pass
+
+    @classmethod
+    def pull_committing(cls):
+        """
+        Called before what was written of a pull so far is committed, to
+        bring whatever is derived from it up to date in the same commit.
+        """
+        pass
+
+    @classmethod
+    def pull_finished(cls, api, started_at, window=None):
+        pass
+
+    @classmethod
+    def pull(cls, api, full=False, batch_size=BATCH_SIZE, window=None):
+        started_at = datetime.datetime.utcnow()
+        pulled = 0
+
+        cls.pull_started()
+
+        for batch in cls.pull_batches(api, full=full, batch_size=batch_size, window=window):
+            # Digests are only ever committed along with what they skip
+            with db().atomic():
+                pulled += sum(cls.write_batch(batch).values())
+                cls.pull_committing()
+
+            for callback in batch.on_commit:
+                callback()
+
+        cls.pull_finished(api, started_at, window=window)
+
+        return pulled
+
+
+class Account(FreshbooksModel):
     id = CharField(unique=True, primary_key=True)
 
     display_fields = [
         ('id', 'Account ID: %s')
     ]
 
-    @classmethod
-    def pull(cls, api):
-        accounts = []
+    pull_fields = [
+        ('id', 'id'),
+    ]
 
+    @classmethod
+    def pull_pages(cls, api, full=False, window=None):
         for business in api.businesses():
-            account = business.account()
-            accounts.append({
-                'id': account.info['id']
-            })
-
-        cls.upsert(accounts)
+            yield business, [business.account().info]
 
     def __repr__(self):
         return str(self.id)
 
 
-class Business(BaseModel):
+class Business(FreshbooksModel):
     id = IntegerField(primary_key=True)
     account = ForeignKeyField(Account)
     name = CharField(default='')
@@ -106,24 +520,21 @@ class Business(BaseModel):
         ('name', 'Business Name: %s')
     ]
 
-    @classmethod
-    def pull(cls, api):
-        businesses = []
-
-        for business in api.businesses():
-            businesses.append({
-                'id': business.info['id'],
-                'account': business.info['account_id'],
-                'name': business.info['name']
-            })
+    pull_fields = [
+        ('id', 'id'),
+        ('account', 'account_id'),
+        ('name', 'name'),
+    ]
 
-        cls.upsert(businesses)
+    @classmethod
+    def pull_pages(cls, api, full=False, window=None):
+        yield api, [business.info for business in api.businesses()]
 
     def __repr__(self):
         return self.name
 
 
-class Client(BaseModel):
+class Client(FreshbooksModel):
     id = IntegerField(primary_key=True)
     account = ForeignKeyField(Account)
     fname = CharField(default='')
@@ -151,30 +562,29 @@ class Client(BaseModel):
         else:
             raise cls.DoesNotExist('Must specify search criteria')
 
+    pull_fields = [
+        ('id', 'id'),
+        ('account', source_info('id')),
+        ('fname', 'fname'),
+        ('lname', 'lname'),
+        ('organization', 'organization'),
+        ('email', 'email'),
+    ]
+
     @classmethod
-    def pull(cls, api):
-        clients = []
+    def pull_pages(cls, api, full=False, window=None):
+        client_id = window_client_id(window)
 
         for business in api.businesses():
             account = business.account()
-            for page in account.client_pages():
-                for client in page:
-                    clients.append({
-                        'id': client['id'],
-                        'account': account.info['id'],
-                        'fname': client['fname'],
-                        'lname': client['lname'],
-                        'organization': client['organization'],
-                        'email': client['email'],
-                    })
-
-        cls.upsert(clients)
+            for page in account.client_pages(client_id=client_id):
+                yield account, page
 
     def __repr__(self):
         return self.organization
 
 
-class Project(BaseModel):
+class Project(FreshbooksModel):
     id = IntegerField(primary_key=True)
     business = ForeignKeyField(Business)
     client = ForeignKeyField(Client)
@@ -191,24 +601,23 @@ class Project(BaseModel):
         ('type', 'Type: %s'),
     ]
 
+    pull_fields = [
+        ('id', 'id'),
+        ('business', source_info('id')),
+        ('client', 'client_id'),
+        ('title', 'title'),
+        ('type', 'project_type'),
+        ('rate', 'rate'),
+        ('fixed_price', 'fixed_price'),
+    ]
+
     @classmethod
-    def pull(cls, api):
-        projects = []
+    def pull_pages(cls, api, full=False, window=None):
+        client_id = window_client_id(window)
 
         for business in api.businesses():
-            for page in business.project_pages():
-                for project in page:
-                    projects.append({
-                        'id': project['id'],
-                        'business': business.info['id'],
-                        'client': project['client_id'],
-                        'title': project['title'],
-                        'type': project['project_type'],
-                        'rate': project['rate'],
-                        'fixed_price': project['fixed_price'],
-                    })
-
-        cls.upsert(projects)
+            for page in business.project_pages(client_id=client_id):
+                yield business, page
 
     @property
     def hourly_rate(self):
@@ -221,7 +630,7 @@ class Project(BaseModel):
         return self.title
 
 
-class Task(BaseModel):
+class Task(FreshbooksModel):
     id = IntegerField(primary_key=True)
     name = CharField(default='')
     description = CharField(default='')
@@ -232,27 +641,24 @@ class Task(BaseModel):
         ('description', 'Description: %s'),
     ]
 
-    @classmethod
-    def pull(cls, api):
-        tasks = []
+    pull_fields = [
+        ('id', 'id'),
+        ('name', 'name'),
+        ('description', 'description'),
+    ]
 
+    @classmethod
+    def pull_pages(cls, api, full=False, window=None):
         for business in api.businesses():
             account = business.account()
             for page in account.task_pages():
-                for task in page:
-                    tasks.append({
-                        'id': task['id'],
-                        'name': task['name'],
-                        'description': task['description'],
-                    })
-
-        cls.upsert(tasks)
+                yield account, page
 
     def __repr__(self):
         return self.name
 
 
-class TimeEntry(BaseModel):
+class TimeEntry(FreshbooksModel):
     id = IntegerField(primary_key=True)
     client = ForeignKeyField(Client)
     project = ForeignKeyField(Project, null=True)
@@ -280,6 +686,27 @@ class TimeEntry(BaseModel):
 
     note = TextField(null=True)
 
+    class Meta:
+        indexes = (
+            # Summary windows, with and without a client
+            (('started_at', 'client'), False),
+            (('client', 'started_at'), False),
+
+            # Summary groupings, carrying the columns they filter on and
+            # add up, so that grouping needs no trip back to the table
+            (('started_at_date', 'client', 'project', 'task',
+              'started_at', 'duration', 'billed'), False),
+            (('started_at_week_ending_date', 'client', 'project', 'task',
+              'started_at', 'duration', 'billed'), False),
+            (('started_at_month_ending_date', 'client', 'project', 'task',
+              'started_at', 'duration', 'billed'), False),
+            (('started_at_year_ending_date', 'client', 'project', 'task',
+              'started_at', 'duration', 'billed'), False),
+
+            # Logging windows
+            (('created_at', 'client'), False),
+        )
+
     display_fields = [
         ('id', 'TimeEntry ID: %s'),
         ('client', 'Client: %s'),
@@ -290,50 +717,220 @@ class TimeEntry(BaseModel):
     ]
 
     @classmethod
-    def pull(cls, api):
-        entries = []
+    def get_the_one(cls, **kwargs):
+        if 'id' in kwargs:
+            return cls.get(
+                cls.id == kwargs['id']
+            )
+        else:
+            raise cls.DoesNotExist('Must specify search criteria')
+
+    pull_fields = [
+        ('id', 'id'),
+        ('client', 'client_id'),
+        ('project', 'project_id'),
+        ('task', 'task_id'),
+        ('duration', 'duration'),
+        ('billed', 'billed'),
+        ('billable', 'billable'),
+        ('note', 'note'),
+    ]
+
+    @classmethod
+    def pull_pages(cls, api, full=False, window=None):
+        filters = {}
+
+        if window is not None:
+            filters['client_id'] = window_client_id(window)
+
+            if window.start_date is not None:
+                filters['started_from'] = utc_from_local_datetime(window.start_date)
+            if window.end_date is not None:
+                filters['started_to'] = utc_from_local_datetime(window.end_date)
 
         for business in api.businesses():
-            for page in business.time_entry_pages():
-                for entry in page:
-
-                    created_at = local_from_utc_datetime(entry['created_at'])
-                    started_at = local_from_utc_datetime(entry['started_at'])
-
-                    created_at_date = created_at.date()
-                    started_at_date = started_at.date()
-
-                    created_at_week_ending_date = week_ending_datetime(created_at_date).date()
-                    started_at_week_ending_date = week_ending_datetime(started_at_date).date()
-
-                    created_at_month_ending_date = month_ending_datetime(created_at_date).date()
-                    started_at_month_ending_date = month_ending_datetime(started_at_date).date()
-
-                    created_at_year_ending_date = year_ending_datetime(created_at_date).date()
-                    started_at_year_ending_date = year_ending_datetime(started_at_date).date()
-
-                    entries.append({
-                        'id': entry['id'],
-                        'client': entry['client_id'],
-                        'project': entry['project_id'],
-                        'task': entry['task_id'],
-                        'created_at': created_at,
-                        'created_at_date': created_at_date,
-                        'created_at_week_ending_date': created_at_week_ending_date,
-                        'created_at_month_ending_date': created_at_month_ending_date,
-                        'created_at_year_ending_date': created_at_year_ending_date,
-                        'started_at': started_at,
-                        'started_at_date': started_at_date,
-                        'started_at_week_ending_date': started_at_week_ending_date,
-                        'started_at_month_ending_date': started_at_month_ending_date,
-                        'started_at_year_ending_date': started_at_year_ending_date,
-                        'duration': entry['duration'],
-                        'billed': entry['billed'],
-                        'billable': entry['billable'],
-                        'note': entry['note']
-                    })
-
-        cls.upsert(entries)
+            # Windowed pulls do not cover everything that changed, so they
+            # neither use nor move the watermark.
+            updated_since = None
+            if not full and window is None:
+                updated_since = MetaData.get_sync_watermark(cls, business.info['id'])
+
+            for page in business.time_entry_pages(updated_since=updated_since, **filters):
+                yield business, page
+
+    @classmethod
+    def pull_record(cls, source, record):
+        row = super(TimeEntry, cls).pull_record(source, record)
+
+        with phase('date bucketing', rows=1):
+            row.update(date_bucket_columns(
+                created_at=record['created_at'],
+                started_at=record['started_at']))
+
+        return row
+
+    # Days whose entries were written since the rollup was last refreshed
+    changed_days = set()
+
+    @classmethod
+    def upsert(cls, data):
+        # Only entries that are inserted or updated change their days
+        changed = data
+        if data:
+            fields = [cls._meta.fields[name] for name in data[0]]
+            unchanged = _unchanged_keys(
+                cls, fields, [cls.id],
+                [[field.db_value(row[field.name]) for field in fields] for row in data])
+            changed = [row for row in data if (row['id'],) not in unchanged]
+
+        days = set(row['started_at_date'] for row in changed)
+
+        # Entries that moved to another day leave the old one changed too
+        ids = [row['id'] for row in changed]
+        for chunk in chunked(ids, SQLITE_MAX_VARIABLES):
+            days.update(
+                day for (day,) in cls.select(cls.started_at_date).where(
+                    cls.id << chunk).tuples())
+
+        cls.changed_days.update(days)
+
+        return super(TimeEntry, cls).upsert(data)
+
+    @classmethod
+    def pull_started(cls):
+        # Days left over from a pull that failed were rolled back with it
+        cls.changed_days.clear()
+
+    @classmethod
+    def pull_finished(cls, api, started_at, window=None):
+        # started_at was taken before any request went out, so that entries
+        # updated while the pull was running are picked up again next time.
+        if window is None:
+            for business in api.businesses():
+                MetaData.update_sync_watermark(cls, business.info['id'], started_at)
+
+        if TimeEntryDay.is_current():
+            cls.pull_committing()
+        else:
+            TimeEntryDay.refresh()
+
+        cls.changed_days.clear()
+
+    @classmethod
+    def pull_committing(cls):
+        # Readers never see entries the rollup doesn't add up to yet.  One
+        # that isn't current is not read, and is rebuilt once the pull ends.
+        if cls.changed_days and TimeEntryDay.is_current():
+            TimeEntryDay.refresh(cls.changed_days)
+            cls.changed_days.clear()
+
+
+class TimeEntryDay(BaseModel):
+    """
+    TimeEntry totals per day, client, project and task, so that summaries
+    over long periods cost a row per day rather than a row per entry.
+    TimeEntry pulls refresh only the days they changed.
+    """
+    started_at_date = DateField()
+    started_at_week_ending_date = DateField()
+    started_at_month_ending_date = DateField()
+    started_at_year_ending_date = DateField()
+
+    client = ForeignKeyField(Client)
+    project = ForeignKeyField(Project, null=True)
+    task = ForeignKeyField(Task, null=True)
+
+    duration = IntegerField()
+    entries = IntegerField()
+    first_started_at = DateTimeField()
+    last_started_at = DateTimeField()
+    billed_duration = IntegerField()
+    billable_duration = IntegerField()
+    billed_entries = IntegerField()
+    billable_entries = IntegerField()
+
+    class Meta:
+        indexes = (
+            (('started_at_date', 'client', 'project', 'task'), False),
+        )
+
+    display_fields = [
+        ('started_at_date', 'Day: %s'),
+        ('client', 'Client: %s'),
+        ('project', 'Project: %s'),
+        ('task', 'Task: %s'),
+        ('duration', 'Duration (seconds): %s'),
+    ]
+
+    @classmethod
+    def is_current(cls):
+        """ Whether the rollup has been built since the cache was initialized """
+        return (MetaData.get_last_pulled_time(cls) is not None and
+                cls.table_exists())
+
+    @classmethod
+    def refresh(cls, days=None):
+        """ Recomputes the given days from TimeEntry, or every day if None """
+        if not cls.table_exists():
+            cls.create_table()
+
+        with db().atomic(), phase('rollup'):
+            if days is None:
+                cls.delete().execute()
+                cls._insert_days()
+            else:
+                for chunk in chunked(days, SQLITE_MAX_VARIABLES):
+                    cls.delete().where(cls.started_at_date << chunk).execute()
+                    cls._insert_days(chunk)
+
+            MetaData.update_last_pulled_time(cls)
+
+    @classmethod
+    def _insert_days(cls, days=None):
+        # Sqlite stores booleans as 0 or 1
+        totals = TimeEntry.select(
+            TimeEntry.started_at_date,
+            TimeEntry.started_at_week_ending_date,
+            TimeEntry.started_at_month_ending_date,
+            TimeEntry.started_at_year_ending_date,
+            TimeEntry.client,
+            TimeEntry.project,
+            TimeEntry.task,
+            fn.Sum(TimeEntry.duration),
+            fn.Count(TimeEntry.id),
+            fn.Min(TimeEntry.started_at),
+            fn.Max(TimeEntry.started_at),
+            fn.Sum(TimeEntry.duration * TimeEntry.billed),
+            fn.Sum(TimeEntry.duration * TimeEntry.billable),
+            fn.Sum(TimeEntry.billed),
+            fn.Sum(TimeEntry.billable),
+        ).group_by(
+            TimeEntry.started_at_date,
+            TimeEntry.client,
+            TimeEntry.project,
+            TimeEntry.task,
+        )
+
+        if days is not None:
+            totals = totals.where(TimeEntry.started_at_date << days)
+
+        cls.insert_from([
+            cls.started_at_date,
+            cls.started_at_week_ending_date,
+            cls.started_at_month_ending_date,
+            cls.started_at_year_ending_date,
+            cls.client,
+            cls.project,
+            cls.task,
+            cls.duration,
+            cls.entries,
+            cls.first_started_at,
+            cls.last_started_at,
+            cls.billed_duration,
+            cls.billable_duration,
+            cls.billed_entries,
+            cls.billable_entries,
+        ], totals).execute()
 
 
 class LogDestination(BaseModel):
@@ -361,9 +958,16 @@ class TaskLog(BaseModel):
     created_at = DateTimeField(default=datetime.datetime.now)
     created_at_date = DateField(default=datetime.datetime.now)
 
+    class Meta:
+        indexes = (
+            # An entry is logged to a destination once
+            (('time_entry', 'log_destination'), True),
+        )
+
 
 ALL_MODELS = [
     TimeEntry,
+    TimeEntryDay,
     Task,
     Project,
     Client,
@@ -371,6 +975,7 @@ ALL_MODELS = [
     Business,
     LogDestination,
     TaskLog,
+    PullDigest,
 ]
 
 
@@ -0,0 +1,203 @@
+import json
+import time
+import pstats
+import cProfile
+import threading
+import StringIO
+
+# Hot spots logged from a cProfile dump
+HOT_SPOTS = 15
+
+_active = None
+
+
+class _Phase(object):
+    def __init__(self, name, rows=0):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        profile = _active
+        if profile is not None:
+            profile.add_phase(self.name, time.time() - self.started, self.rows)
+
+
+class _NoPhase(object):
+    rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def phase(name, rows=0):
+    """
+    Times a block of work as part of the named phase, when profiling.
+    Rows processed can be passed in, or counted on the returned phase.
+    Phases run by concurrent threads add up to more than the wall time.
+    """
+    if _active is None:
+        return _NO_PHASE
+
+    return _Phase(name, rows)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Profile(object):
+    """
+    Collects phase timings, HTTP requests and SQL statements while a
+    command runs.
+    """
+
+    def __init__(self, database, cprofile=False):
+        self.database = database
+        self.phases = {}
+        self.requests = []
+        self.statements = {}
+        self.cprofile = cProfile.Profile() if cprofile else None
+
+        self._lock = threading.Lock()
+        self._execute_sql = None
+
+    def start(self):
+        global _active
+
+        # Imported here, so that commands that never profile don't pull in
+        # requests just for this module
+        import refresh2.transport
+
+        self.started = time.time()
+        _active = self
+
+        refresh2.transport.listeners.append(self.on_api_event)
+
+        # peewee has no hook for statements, so time them at the source
+        self._execute_sql = self.database.execute_sql
+        self.database.execute_sql = self.execute_sql
+
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+        return self
+
+    def stop(self):
+        global _active
+        import refresh2.transport
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+        del self.database.execute_sql
+        refresh2.transport.listeners.remove(self.on_api_event)
+
+        _active = None
+        self.elapsed = time.time() - self.started
+
+    def add_phase(self, name, seconds, rows=0):
+        with self._lock:
+            totals = self.phases.setdefault(name, [0.0, 0, 0])
+            totals[0] += seconds
+            totals[1] += 1
+            totals[2] += rows
+
+    def on_api_event(self, event, seconds, size=0, status=None):
+        if event == 'request':
+            with self._lock:
+                self.requests.append((seconds, size, status))
+
+        self.add_phase('http' if event == 'request' else 'json decoding', seconds)
+
+    def execute_sql(self, sql, *args, **kwargs):
+        started = time.time()
+
+        try:
+            return self._execute_sql(sql, *args, **kwargs)
+        finally:
+            seconds = time.time() - started
+            verb = sql.split(None, 1)[0].upper()
+
+            with self._lock:
+                totals = self.statements.setdefault(verb, [0, 0.0])
+                totals[0] += 1
+                totals[1] += seconds
+
+    def report(self):
+        latencies = sorted(seconds for seconds, _, _ in self.requests)
+
+        phases = {}
+        for name, (seconds, calls, rows) in self.phases.items():
+            phases[name] = {
+                'seconds': seconds,
+                'calls': calls,
+                'rows': rows,
+                'rows_per_second': rows / seconds if rows and seconds else None,
+            }
+
+        return {
+            'elapsed': self.elapsed,
+            'phases': phases,
+            'http': {
+                'requests': len(latencies),
+                'bytes': sum(size for _, size, _ in self.requests),
+                'seconds': sum(latencies),
+                'p50': percentile(latencies, 0.5),
+                'p90': percentile(latencies, 0.9),
+                'p99': percentile(latencies, 0.99),
+                'max': latencies[-1] if latencies else 0.0,
+            },
+            'sql': dict(
+                (verb, {'statements': count, 'seconds': seconds})
+                for verb, (count, seconds) in self.statements.items()),
+        }
+
+    def log(self, logger):
+        report = self.report()
+        http = report['http']
+
+        logger.info('')
+        logger.info('Profile: %0.3fs' % report['elapsed'])
+
+        phases = sorted(report['phases'].items(), key=lambda item: -item[1]['seconds'])
+        for name, timing in phases:
+            line = '  %-20s %8.3fs %8d calls' % (name, timing['seconds'], timing['calls'])
+            if timing['rows_per_second']:
+                line += ' %10d rows %10.0f rows/s' % (timing['rows'], timing['rows_per_second'])
+            logger.info(line)
+
+        if http['requests']:
+            logger.info('  HTTP: %d requests, %d bytes, p50 %0.1fms, p90 %0.1fms, '
+                        'p99 %0.1fms, max %0.1fms' % (
+                            http['requests'], http['bytes'], http['p50'] * 1000,
+                            http['p90'] * 1000, http['p99'] * 1000, http['max'] * 1000))
+
+        for verb, timing in sorted(report['sql'].items()):
+            logger.info('  SQL %-8s %8d statements %8.3fs' % (
+                verb, timing['statements'], timing['seconds']))
+
+        if self.cprofile is not None:
+            stream = StringIO.StringIO()
+            stats = pstats.Stats(self.cprofile, stream=stream)
+            stats.sort_stats('cumulative').print_stats(HOT_SPOTS)
+            logger.info(stream.getvalue())
+
+    def dump(self, filename):
+        with open(filename, 'w') as out:
+            json.dump(self.report(), out, indent=2, sort_keys=True)
+
+    def dump_cprofile(self, filename):
+        self.cprofile.dump_stats(filename)
@@ -0,0 +1,228 @@
+"""
+A columnar snapshot of the cache, written next to the database by
+`fresh pull --snapshot`, that reports can memory-map instead of reading
+rows back out of sqlite.
+
+The file holds a JSON header, with the time the cache was last pulled and
+the client, project and task names, followed by one fixed-width array per
+TimeEntryFrame column, each aligned to ALIGNMENT bytes.  It is only used
+while the cache has not been pulled since it was written.
+"""
+import os
+import json
+import mmap
+import struct
+import datetime
+import tempfile
+from date import LOCAL_TIMEZONE
+from models import db, MetaData, Client, Project, Task, TimeEntry
+
+MAGIC = 'FRESHSNP'
+VERSION = 1
+ALIGNMENT = 64
+
+# magic, version, header length
+PREAMBLE = struct.Struct('<8sII')
+
+# Models whose data a snapshot holds
+SNAPSHOT_MODELS = [Client, Project, Task, TimeEntry]
+
+
+def snapshot_path(database=None):
+    return (database or db()).database + '.snapshot'
+
+
+def pulled_at():
+    """ When the models a snapshot holds were last pulled, as a string """
+    times = [MetaData.get_last_pulled_time(model) for model in SNAPSHOT_MODELS]
+
+    if None in times:
+        return None
+
+    return max(times).isoformat()
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_snapshot(path=None):
+    """ Writes the cache's time entries out to a snapshot file """
+    from analytics import COLUMNS, TimeEntryFrame
+
+    if path is None:
+        path = snapshot_path()
+
+    frame = TimeEntryFrame.load()
+
+    header = {
+        'pulled_at': pulled_at(),
+        'rows': len(frame),
+        'columns': [],
+        'clients': dict((client.id, client.organization) for client in Client.select()),
+        'projects': dict((project.id, [project.title, project.hourly_rate])
+                         for project in Project.select()),
+        'tasks': dict((task.id, task.name) for task in Task.select()),
+    }
+
+    # Column offsets depend on the header's length, which depends on them
+    offset = 0
+    for name, kind, _ in COLUMNS:
+        header['columns'].append([name, kind, offset])
+        offset = _aligned(offset + frame.column(name).nbytes)
+
+    encoded = json.dumps(header)
+    start = _aligned(PREAMBLE.size + len(encoded))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+
+    try:
+        with os.fdopen(handle, 'wb') as out:
+            out.write(PREAMBLE.pack(MAGIC, VERSION, len(encoded)))
+            out.write(encoded)
+
+            for name, kind, column_offset in header['columns']:
+                out.seek(start + column_offset)
+                out.write(frame.column(name).tobytes())
+
+        os.rename(temporary, path)
+    except:
+        os.remove(temporary)
+        raise
+
+    return path
+
+
+class Snapshot(object):
+
+    def __init__(self, header, frame, buffer):
+        self.pulled_at = header['pulled_at']
+        self.frame = frame
+        self.clients = dict((int(id), name) for id, name in header['clients'].items())
+        self.projects = dict((int(id), project) for id, project in header['projects'].items())
+        self.tasks = dict((int(id), name) for id, name in header['tasks'].items())
+
+        # The columns are views of the mapped file
+        self._buffer = buffer
+
+    @classmethod
+    def open(cls, path):
+        from analytics import TimeEntryFrame, numpy
+
+        with open(path, 'rb') as snapshot:
+            buffer = mmap.mmap(snapshot.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, length = PREAMBLE.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a version %s snapshot: %s' % (VERSION, path))
+
+        header = json.loads(buffer[PREAMBLE.size:PREAMBLE.size + length])
+        start = _aligned(PREAMBLE.size + length)
+
+        columns = {}
+        for name, kind, offset in header['columns']:
+            columns[name] = numpy.frombuffer(
+                buffer, dtype=kind, count=header['rows'], offset=start + offset)
+
+        return cls(header, TimeEntryFrame(columns), buffer)
+
+    def is_current(self):
+        return self.pulled_at is not None and self.pulled_at == pulled_at()
+
+    def period_records(self, period, window):
+        """
+        The records of a TimePeriodByClientProject summary by the given
+        period, in the same order and with the same values.
+        """
+        from analytics import NONE_ID
+
+        client = window.client.id if window.client is not None else None
+        totals = self.frame.summarize(
+            by=(period, 'client', 'project'),
+            start_date=window.start_date,
+            end_date=window.end_date,
+            client=client)
+
+        periods = totals[period].astype('datetime64[D]').astype(object)
+        first_dates = _local_datetime_strings(totals['first_started_at'])
+        last_dates = _local_datetime_strings(totals['last_started_at'])
+        hours = totals['duration'] / 3600.0
+
+        for i in xrange(len(periods)):
+            client_id = int(totals['client'][i])
+            project_id = int(totals['project'][i])
+
+            # Like the LEFT OUTER JOIN, entries without a project have none
+            if project_id in self.projects:
+                title, hourly_rate = self.projects[project_id]
+                invoice_amount = hourly_rate * float(hours[i])
+            else:
+                title = invoice_amount = None
+
+            yield (
+                periods[i],
+                client_id,
+                self.clients.get(client_id),
+                project_id if project_id != NONE_ID else None,
+                title,
+                float(hours[i]),
+                invoice_amount,
+                first_dates[i],
+                last_dates[i],
+            )
+
+
+def _utc_offset(epoch_seconds):
+    local = datetime.datetime.fromtimestamp(int(epoch_seconds), LOCAL_TIMEZONE)
+    return int(local.utcoffset().total_seconds())
+
+
+def _offset_suffix(offset):
+    sign = '-' if offset < 0 else '+'
+    return '%s%02d:%02d' % (sign, abs(offset) // 3600, abs(offset) % 3600 // 60)
+
+
+def _local_datetime_strings(epochs):
+    """
+    Formats UTC epoch seconds the way TimeEntry stores its local times.
+    UTC offsets are looked up once per day, and once per time only on the
+    days the offset changes, since converting each time is what's slow.
+    """
+    import numpy
+
+    days, index = numpy.unique(epochs // 86400, return_inverse=True)
+    starts = numpy.array([_utc_offset(day * 86400) for day in days], dtype='i8')
+    ends = numpy.array([_utc_offset(day * 86400 + 86399) for day in days], dtype='i8')
+
+    offsets = starts[index]
+    for i in numpy.flatnonzero((starts != ends)[index]):
+        offsets[i] = _utc_offset(epochs[i])
+
+    local = (epochs + offsets).astype('datetime64[s]')
+    suffixes = dict((offset, _offset_suffix(offset)) for offset in set(offsets.tolist()))
+
+    return [text.replace('T', ' ') + suffixes[offset]
+            for text, offset in zip(numpy.datetime_as_string(local).tolist(),
+                                    offsets.tolist())]
+
+
+def current_snapshot(path=None):
+    """ The cache's snapshot, if there is one and nothing was pulled since """
+    if path is None:
+        path = snapshot_path()
+
+    # Reports without a snapshot should not pay for importing numpy
+    if not os.path.exists(path):
+        return None
+
+    from analytics import numpy
+    if numpy is None:
+        return None
+
+    try:
+        snapshot = Snapshot.open(path)
+    except (IOError, ValueError):
+        return None
+
+    return snapshot if snapshot.is_current() else None
@@ -2,9 +2,11 @@ import os
 import collections
 from peewee import *
 from refresh2.util import memoize
-from models import Account, Business, Client, Project, Task, TimeEntry
+from models import Account, Business, Client, Project, Task, TimeEntry, TimeEntryDay
 from exceptions import *
-from util import head, coalate, currency
+from util import head, grouped, currency
+from profiling import phase
+from snapshot import current_snapshot
 
 
 class Summary(object):
@@ -20,34 +22,100 @@ class Summary(object):
     def format_row(self, row):
         raise ImproperlyConfiguredException()
 
+    def record_names(self):
+        raise ImproperlyConfiguredException()
+
+    def records(self):
+        """ Flat tuples of the report's figures, in record_names() order """
+        raise ImproperlyConfiguredException()
+
     def print_report(self, printer):
-        for row in self.query_set():
-            header = self.format_title(row).encode('utf8', 'replace')
-            bars = '-' * len(header)
+        rows = iter(self.query_set())
 
-            printer(bars)
-            printer(header)
-            printer(bars)
-            printer(self.format_row(row).encode('utf8', 'replace'))
-            printer('')
+        while True:
+            # Rows stream out of the query as they are grouped
+            with phase('query and grouping'):
+                row = next(rows, None)
+
+            if row is None:
+                break
+
+            with phase('formatting', rows=1):
+                header = self.format_title(row).encode('utf8', 'replace')
+                bars = '-' * len(header)
+
+                printer(bars)
+                printer(header)
+                printer(bars)
+                printer(self.format_row(row).encode('utf8', 'replace'))
+                printer('')
 
 
 class TaskTimeEntrySummaryMixin(object):
     aggregate_by = ()
 
+    # Names of the fields reports are grouped by, outermost first.  Rows are
+    # ordered by them, so that groups can be streamed out one at a time.
+    grouped_by = ()
+
+    def ordering(self, model):
+        return [getattr(model, name) for name in self.grouped_by] + [SQL('last_date')]
+
+    @property
+    def source_model(self):
+        return TimeEntry
+
+    def record_columns(self, model):
+        """ (name, column) pairs selected for each exported record """
+        raise ImproperlyConfiguredException()
+
+    def aggregates(self):
+        """ Aliased aggregates selected with the report's rows, beyond the totals """
+        return []
+
+    def record_names(self):
+        return [name for name, _ in self.record_columns(self.source_model)]
+
+    def records(self):
+        # Only the exported columns are selected, and rows come back as
+        # plain tuples, so nothing is built per row but the tuple itself.
+        columns = self.record_columns(self.source_model)
+        query = self.query().select(*[column.alias(name) for name, column in columns])
+
+        return query.tuples().iterator()
+
     def query_set(self):
+        if not self.grouped_by:
+            return self.query()
+
+        return grouped(self.query().iterator(), self.grouped_by)
+
+    def query(self):
+        # Client and Project are selected along with the entries, so that
+        # reports do not go back to the database for every row they format.
         qs = TimeEntry.select(
             TimeEntry,
             Task,
+            Client,
+            Project,
             fn.Sum(TimeEntry.duration).alias('total_time'),
             fn.Min(TimeEntry.started_at).alias('first_date'),
-            fn.Max(TimeEntry.started_at).alias('last_date')
+            fn.Max(TimeEntry.started_at).alias('last_date'),
+            *self.aggregates()
         ).join(
             Task, JOIN_LEFT_OUTER
+        ).switch(
+            TimeEntry
+        ).join(
+            Client, JOIN_LEFT_OUTER
+        ).switch(
+            TimeEntry
+        ).join(
+            Project, JOIN_LEFT_OUTER
         ).group_by(
             *self.aggregate_by
         ).order_by(
-            SQL('last_date')
+            *self.ordering(TimeEntry)
         )
 
         if self.window.client is not None:
@@ -77,6 +145,17 @@ class TasksByClient(TaskTimeEntrySummaryMixin, Summary):
     def __init__(self, time_entry_window=None):
         self.window = time_entry_window
 
+    def record_columns(self, model):
+        return [
+            ('task_id', TimeEntry.task),
+            ('task', Task.name),
+            ('client_id', TimeEntry.client),
+            ('client', Client.organization),
+            ('hours', fn.Sum(TimeEntry.duration) / 3600.0),
+            ('first_date', fn.Min(TimeEntry.started_at)),
+            ('last_date', fn.Max(TimeEntry.started_at)),
+        ]
+
     def format_title(self, row):
         return row.task.name
 
@@ -99,15 +178,32 @@ class DaysByClientProjectTask(TaskTimeEntrySummaryMixin, Summary):
         TimeEntry.started_at_date,
     )
 
+    grouped_by = ('started_at_date', 'client', 'project')
+
+    # Whether any of the task's entries that day were billed, the same for
+    # the text report as for exports
+    billed = fn.Max(TimeEntry.billed)
+
     def __init__(self, time_entry_window=None):
         self.window = time_entry_window
 
-    def query_set(self):
-        tasks = super(DaysByClientProjectTask, self).query_set()
-
-        day_client_project_tasks = coalate(
-            tasks, by=['started_at_date', 'client', 'project'])
-        return day_client_project_tasks.values()
+    def aggregates(self):
+        return [self.billed.alias('any_billed')]
+
+    def record_columns(self, model):
+        return [
+            ('date', TimeEntry.started_at_date),
+            ('client_id', TimeEntry.client),
+            ('client', Client.organization),
+            ('project_id', TimeEntry.project),
+            ('project', Project.title),
+            ('task_id', TimeEntry.task),
+            ('task', Task.name),
+            ('hours', fn.Sum(TimeEntry.duration) / 3600.0),
+            ('billed', self.billed),
+            ('first_date', fn.Min(TimeEntry.started_at)),
+            ('last_date', fn.Max(TimeEntry.started_at)),
+        ]
 
     def format_title(self, row):
         return str(head(head(head(row))).started_at_date)
@@ -130,12 +226,32 @@ class DaysByClientProjectTask(TaskTimeEntrySummaryMixin, Summary):
 """ % (
                         task.task.name if task.task else '<UNCATEGORIZED>',
                         task.total_time / 60.0 / 60.0,
-                        'Yes' if task.billed else 'No'))
+                        'Yes' if task.any_billed else 'No'))
 
         return os.linesep.join(formatted)
 
 
 class TimePeriodByClientProject(TaskTimeEntrySummaryMixin, Summary):
+    def __init__(self, time_entry_window=None):
+        self.window = self.aligned(time_entry_window)
+        self._use_rollup = None
+
+    def aligned(self, time_entry_window):
+        return time_entry_window
+
+    @property
+    def use_rollup(self):
+        # Windows are aligned to whole periods, so whole days always cover
+        # them, and the daily rollup can be used whenever it is built.  This
+        # is decided when the report runs, not when it is made.
+        if self._use_rollup is None:
+            self._use_rollup = TimeEntryDay.is_current()
+        return self._use_rollup
+
+    @use_rollup.setter
+    def use_rollup(self, value):
+        self._use_rollup = value
+
     @property
     def aggregate_by(self):
         return (
@@ -144,14 +260,93 @@ class TimePeriodByClientProject(TaskTimeEntrySummaryMixin, Summary):
             TimeEntry.project,
         )
 
-    def query_set(self):
-        tasks = super(TimePeriodByClientProject, self).query_set()
+    @property
+    def grouped_by(self):
+        return [field.name for field in self.aggregate_by]
 
-        aggregate_by_names = map(lambda field: field.name, self.aggregate_by)
+    # Exported records come from the cache's snapshot while it is current
+    use_snapshot = True
 
-        week_client_project_tasks = coalate(
-            tasks, by=aggregate_by_names)
-        return week_client_project_tasks.values()
+    @property
+    def source_model(self):
+        return TimeEntryDay if self.use_rollup else TimeEntry
+
+    def records(self):
+        snapshot = current_snapshot() if self.use_snapshot else None
+
+        if snapshot is not None:
+            return snapshot.period_records(self.period, self.window)
+
+        return super(TimePeriodByClientProject, self).records()
+
+    def record_columns(self, model):
+        if model is TimeEntryDay:
+            first_date = fn.Min(TimeEntryDay.first_started_at)
+            last_date = fn.Max(TimeEntryDay.last_started_at)
+        else:
+            first_date = fn.Min(TimeEntry.started_at)
+            last_date = fn.Max(TimeEntry.started_at)
+
+        hours = fn.Sum(model.duration) / 3600.0
+
+        # Only hourly projects have a rate to invoice by, see Project.hourly_rate
+        hourly_rate = fn.IfNull(Project.rate, 0) * (Project.type == 'hourly_rate')
+
+        return [
+            ('period_ending', getattr(model, self.time_period_field.name)),
+            ('client_id', model.client),
+            ('client', Client.organization),
+            ('project_id', model.project),
+            ('project', Project.title),
+            ('hours', hours),
+            ('invoice_amount', hourly_rate * hours),
+            ('first_date', first_date),
+            ('last_date', last_date),
+        ]
+
+    def query(self):
+        if not self.use_rollup:
+            return super(TimePeriodByClientProject, self).query()
+
+        time_period_field = getattr(TimeEntryDay, self.time_period_field.name)
+
+        qs = TimeEntryDay.select(
+            TimeEntryDay,
+            Client,
+            Project,
+            fn.Sum(TimeEntryDay.duration).alias('total_time'),
+            fn.Min(TimeEntryDay.first_started_at).alias('first_date'),
+            fn.Max(TimeEntryDay.last_started_at).alias('last_date')
+        ).join(
+            Client, JOIN_LEFT_OUTER
+        ).switch(
+            TimeEntryDay
+        ).join(
+            Project, JOIN_LEFT_OUTER
+        ).group_by(
+            time_period_field,
+            TimeEntryDay.client,
+            TimeEntryDay.project,
+        ).order_by(
+            *self.ordering(TimeEntryDay)
+        )
+
+        if self.window.client is not None:
+            qs = qs.where(
+                TimeEntryDay.client == self.window.client
+            )
+
+        if self.window.start_date is not None:
+            qs = qs.where(
+                TimeEntryDay.started_at_date >= self.window.start_date.date()
+            )
+
+        if self.window.end_date is not None:
+            qs = qs.where(
+                TimeEntryDay.started_at_date <= self.window.end_date.date()
+            )
+
+        return qs
 
     def format_row(self, row):
         formatted = []
@@ -176,9 +371,10 @@ class TimePeriodByClientProject(TaskTimeEntrySummaryMixin, Summary):
 
 class WeeksByClientProject(TimePeriodByClientProject, Summary):
     time_period_field = TimeEntry.started_at_week_ending_date
+    period = 'week'
 
-    def __init__(self, time_entry_window=None):
-        self.window = time_entry_window.aligned_to_week_boundaries()
+    def aligned(self, time_entry_window):
+        return time_entry_window.aligned_to_week_boundaries()
 
     def format_title(self, row):
         return 'Week Ending: ' + str(head(head(head(row))).started_at_week_ending_date)
@@ -186,9 +382,10 @@ class WeeksByClientProject(TimePeriodByClientProject, Summary):
 
 class MonthsByClientProject(TimePeriodByClientProject, Summary):
     time_period_field = TimeEntry.started_at_month_ending_date
+    period = 'month'
 
-    def __init__(self, time_entry_window=None):
-        self.window = time_entry_window.aligned_to_month_boundaries()
+    def aligned(self, time_entry_window):
+        return time_entry_window.aligned_to_month_boundaries()
 
     def format_title(self, row):
         return 'Month Ending: ' + str(head(head(head(row))).started_at_month_ending_date)
@@ -196,9 +393,19 @@ class MonthsByClientProject(TimePeriodByClientProject, Summary):
 
 class YearsByClientProject(TimePeriodByClientProject, Summary):
     time_period_field = TimeEntry.started_at_year_ending_date
+    period = 'year'
 
-    def __init__(self, time_entry_window=None):
-        self.window = time_entry_window.aligned_to_year_boundaries()
+    def aligned(self, time_entry_window):
+        return time_entry_window.aligned_to_year_boundaries()
 
     def format_title(self, row):
-        return 'Year Ending: ' + str(head(head(head(row))).started_at_year_ending_date)
\ No newline at end of file
+        return 'Year Ending: ' + str(head(head(head(row))).started_at_year_ending_date)
+
+
+ALL_SUMMARIES = [
+    TasksByClient,
+    DaysByClientProjectTask,
+    WeeksByClientProject,
+    MonthsByClientProject,
+    YearsByClientProject,
+]
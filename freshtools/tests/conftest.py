@@ -0,0 +1,136 @@
+import pytest
+
+from freshtools.cache import pull
+from freshtools.models import ALL_MODELS, MetaData, TimeEntry, db
+from freshtools.util import model_dependency_order, create_tables
+
+
+class UnchangedPage(list):
+    unchanged = True
+
+
+class FakeAccountApi(object):
+    def __init__(self, data, account_id):
+        self.data = data
+        self.info = {'id': account_id}
+
+    def client_pages(self, client_id=None):
+        if self.data.get('clients_unchanged'):
+            return iter([UnchangedPage(self.data['clients'])])
+
+        return iter([self.data['clients']])
+
+    def task_pages(self):
+        return iter([self.data['tasks']])
+
+
+class FakeBusinessApi(object):
+    def __init__(self, data, info):
+        self.data = data
+        self.info = info
+        self.time_entry_requests = []
+        self.time_entry_filters = []
+
+    def account(self):
+        return FakeAccountApi(self.data, self.info['account_id'])
+
+    def project_pages(self, client_id=None):
+        return iter([self.data['projects']])
+
+    def time_entry_pages(self, updated_since=None, **filters):
+        self.time_entry_requests.append(updated_since)
+        self.time_entry_filters.append(filters)
+
+        page_size = 2
+        entries = self.data['time_entries']
+
+        for start in range(0, len(entries), page_size):
+            yield entries[start:start + page_size]
+
+
+class FakeApi(object):
+    """
+    Stands in for refresh2.api.Api, serving a single business out of
+    plain dictionaries.
+    """
+
+    def __init__(self, data):
+        self.business = FakeBusinessApi(
+            data, {'id': 1, 'account_id': 'abc', 'name': 'Business'})
+
+    def businesses(self):
+        return [self.business]
+
+    def cache_stats(self):
+        return {'hits': 0, 'misses': 0, 'shared': 0}
+
+
+def time_entry(id, client_id=10, project_id=20, task_id=30, duration=3600,
+               started_at='2018-02-14T15:00:00Z', created_at='2018-02-14T16:00:00Z'):
+    return {
+        'id': id,
+        'client_id': client_id,
+        'project_id': project_id,
+        'task_id': task_id,
+        'created_at': created_at,
+        'started_at': started_at,
+        'duration': duration,
+        'billed': False,
+        'billable': True,
+        'note': 'Entry %s' % id,
+    }
+
+
+@pytest.fixture
+def freshbooks_data():
+    return {
+        'clients': [
+            {'id': 10, 'fname': 'Ada', 'lname': 'Lovelace',
+             'organization': 'Engines', 'email': 'ada@example.com'},
+        ],
+        'tasks': [
+            {'id': 30, 'name': 'Design', 'description': ''},
+        ],
+        'projects': [
+            {'id': 20, 'client_id': 10, 'title': 'Analytical Engine',
+             'project_type': 'hourly_rate', 'rate': 100.0, 'fixed_price': None},
+        ],
+        'time_entries': [time_entry(id) for id in range(1, 6)],
+    }
+
+
+@pytest.fixture
+def api(freshbooks_data):
+    return FakeApi(freshbooks_data)
+
+
+@pytest.fixture
+def database(tmpdir):
+    db().init(str(tmpdir.join('freshtools.db')))
+
+    create_tables([MetaData.metadata.model])
+    create_tables(model_dependency_order(ALL_MODELS))
+
+    yield db()
+
+    db().close()
+
+
+@pytest.fixture
+def history(database, api, freshbooks_data):
+    freshbooks_data['clients'].append(
+        {'id': 11, 'fname': 'Charles', 'lname': 'Babbage',
+         'organization': 'Difference', 'email': 'charles@example.com'})
+    freshbooks_data['projects'].append(
+        {'id': 21, 'client_id': 11, 'title': 'Difference Engine',
+         'project_type': 'hourly_rate', 'rate': 50.0, 'fixed_price': None})
+
+    freshbooks_data['time_entries'] = [
+        time_entry(
+            id,
+            client_id=10 + id % 2,
+            project_id=20 + id % 2,
+            started_at='2018-%02d-%02dT15:00:00Z' % (1 + id % 12, 1 + id % 28))
+        for id in range(1, 60)]
+
+    pull(api, [TimeEntry])
@@ -0,0 +1,49 @@
+import pytest
+import datetime
+
+numpy = pytest.importorskip('numpy')
+
+from freshtools.analytics import TimeEntryFrame, from_day_number
+from freshtools.entries import time_entry_window
+from freshtools.models import TimeEntry
+from freshtools.summary import WeeksByClientProject
+
+
+def test_frame_loads_typed_columns(history):
+    frame = TimeEntryFrame.load()
+    entry = TimeEntry.get(TimeEntry.id == 1)
+    loaded = dict((name, column[frame.column('id') == 1][0])
+                  for name, column in frame.columns.items())
+
+    assert len(frame) == TimeEntry.select().count()
+    assert loaded['client'] == entry.client_id
+    assert loaded['duration'] == entry.duration
+    assert from_day_number(loaded['day']) == entry.started_at_date
+    assert from_day_number(loaded['week']) == entry.started_at_week_ending_date
+
+
+def test_frame_totals_match_sql_summaries(history):
+    window = time_entry_window(start_date=datetime.datetime(2018, 2, 1),
+                               end_date=datetime.datetime(2018, 10, 31))
+    report = WeeksByClientProject(window)
+    frame = TimeEntryFrame.load()
+
+    expected = [record[:2] + (record[3], record[5])
+                for record in report.records()]
+    totals = [(str(week), client, project, duration / 3600.0)
+              for week, client, project, duration in frame.rows(
+                  by=('week', 'client', 'project'),
+                  start_date=report.window.start_date,
+                  end_date=report.window.end_date)]
+
+    assert sorted(totals) == sorted((str(week), client, project, hours)
+                                    for week, client, project, hours in expected)
+
+
+def test_frame_filters_and_groups_by_anything(history):
+    frame = TimeEntryFrame.load()
+    totals = frame.summarize(by=('task', 'month'), client=[10], billed=False)
+
+    assert totals['entries'].sum() == TimeEntry.select().where(
+        TimeEntry.client == 10, TimeEntry.billed == False).count()
+    assert list(totals['month']) == sorted(totals['month'])
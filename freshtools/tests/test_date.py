@@ -1,4 +1,6 @@
 import pytest
+import datetime
+from dateutil import tz
 from dateutil.parser import parse as dateutil_parse_date
 
 from freshtools.date import *
@@ -31,4 +33,36 @@ def test_year_starting_and_ending_datetime():
 
     start, end = year_starting_and_ending_datetime(date)
     assert start == beginning_of_day(expected_start)
-    assert end == ending_of_day(expected_end)
\ No newline at end of file
+    assert end == ending_of_day(expected_end)
+
+
+@pytest.mark.parametrize('date', [
+    '2018-02-14T15:00:00Z',
+    '2018-02-14T15:00:00.25Z',
+    '2018-02-14T15:00:00.1234567Z',
+    '2018-02-14 15:00:00-05:00',
+    '2018-02-14T15:00:00+0130',
+    '2018-02-14T15:00:00',
+])
+def test_parse_datetime_matches_dateutil(date):
+    assert parse_datetime(date) == dateutil_parse_date(date)
+    assert parse_datetime(date).utcoffset() == dateutil_parse_date(date).utcoffset()
+
+
+def test_date_bucket_columns_match_period_boundaries():
+    started_at = datetime.datetime(2015, 12, 25, 18, 30, tzinfo=UTC_TIMEZONE)
+
+    for hours in range(0, 24 * 800, 7):
+        timestamp = (started_at + datetime.timedelta(hours=hours)).isoformat()
+        columns = date_bucket_columns(started_at=timestamp)
+
+        local = dateutil_parse_date(timestamp).astimezone(tz.tzlocal())
+        date = local.date()
+
+        assert columns == {
+            'started_at': local,
+            'started_at_date': date,
+            'started_at_week_ending_date': week_ending_datetime(date).date(),
+            'started_at_month_ending_date': month_ending_datetime(date).date(),
+            'started_at_year_ending_date': year_ending_datetime(date).date(),
+        }
@@ -0,0 +1,60 @@
+from freshtools.cache import pull
+from freshtools.indexes import Index, explain
+from freshtools.log import log_entries, time_entries, pending_entries, print_pending
+from freshtools.models import LogDestination, TaskLog, TimeEntry
+
+
+def test_logging_again_skips_entries_already_logged(database, api):
+    pull(api, [TimeEntry])
+    destination = LogDestination.create(destination='audit')
+
+    assert log_entries(time_entries(None, None, None), destination) == (5, 0)
+    assert log_entries(time_entries(None, None, None), destination) == (0, 5)
+
+    other = LogDestination.create(destination='billing')
+    assert log_entries(TimeEntry.select().where(TimeEntry.id == 3), other) == (1, 0)
+
+    assert TaskLog.select().count() == 6
+
+
+def test_logging_removes_duplicates_from_before_the_unique_index(database, api):
+    pull(api, [TimeEntry])
+    destination = LogDestination.create(destination='audit')
+
+    index = Index(TaskLog, ('time_entry', 'log_destination'), True)
+    index.drop()
+
+    for id in (1, 1, 2):
+        TaskLog.create(time_entry=id, log_destination=destination)
+
+    assert log_entries(time_entries(None, None, None), destination) == (3, 2)
+    assert index.exists()
+    assert sorted(log.time_entry_id for log in TaskLog.select()) == [1, 2, 3, 4, 5]
+
+
+def test_pending_entries_are_those_not_logged_to_the_destination(history):
+    destination = LogDestination.create(destination='audit')
+    other = LogDestination.create(destination='billing')
+
+    log_entries(TimeEntry.select().where(TimeEntry.id <= 10), destination)
+    log_entries(TimeEntry.select(), other)
+
+    pending = lambda: pending_entries(time_entries(None, None, None), destination)
+    assert sorted(entry.id for entry in pending()) == range(11, 60)
+
+    lines = []
+    assert print_pending(pending(), lines.append) == (49, 49 * 3600)
+
+    assert lines[0] == 'Client: Engines'
+    assert lines[1] == '  Project: Analytical Engine'
+    assert '  Total: 24 entries, 24.00 hours' in lines
+    assert '  Total: 25 entries, 25.00 hours' in lines
+    assert lines[-1] == 'Pending: 49 entries, 49.00 hours'
+
+
+def test_pending_entries_are_looked_up_in_the_unique_index(database):
+    destination = LogDestination.create(destination='audit')
+    pending = pending_entries(time_entries(None, None, None), destination)
+
+    plan = ' '.join(row[-1] for row in explain(pending))
+    assert Index(TaskLog, ('time_entry', 'log_destination'), True).name in plan
@@ -0,0 +1,322 @@
+import pytest
+import logging
+import sqlite3
+import datetime
+
+from peewee import OperationalError, fn
+from freshtools.models import (Account, Client, LogDestination, MetaData,
+                               Project, Task, TaskLog, TimeEntry, TimeEntryDay, ALL_MODELS)
+from freshtools.date import utc_from_local_datetime
+from freshtools.entries import time_entry_window
+from freshtools.util import model_dependency_levels, drop_tables
+from freshtools import cache, models
+from freshtools.cache import pull
+from refresh2.api import Api, Urls
+from refresh2.httpcache import DiskCache
+from refresh2.testing import FakeFreshbooks
+
+
+def test_pull_writes_every_record_in_batches(database, api):
+    pull(api, [TimeEntry], batch_size=2)
+
+    assert Client.select().count() == 1
+    assert Project.select().count() == 1
+    assert Task.select().count() == 1
+    assert TimeEntry.select().count() == 5
+
+    entry = TimeEntry.get(TimeEntry.id == 1)
+    assert entry.client.organization == 'Engines'
+    assert entry.project.title == 'Analytical Engine'
+    assert entry.started_at_week_ending_date == entry.started_at_date.replace(day=18)
+
+
+def test_time_entry_pull_is_incremental(database, api):
+    TimeEntry.pull(api)
+    watermark = MetaData.get_sync_watermark(TimeEntry, 1)
+
+    TimeEntry.pull(api)
+    TimeEntry.pull(api, full=True)
+
+    first, second, full = api.business.time_entry_requests
+    assert first is None
+    assert second == watermark
+    assert full is None
+
+
+def test_pull_stops_fetching_once_the_writer_fails(database, api, freshbooks_data,
+                                                  monkeypatch):
+    pull(api, [Client, Project, Task])
+    entry = freshbooks_data['time_entries'][0]
+    freshbooks_data['time_entries'] = [dict(entry, id=id) for id in range(1, 1001)]
+
+    mapped = []
+    pull_record = TimeEntry.pull_record
+    monkeypatch.setattr(TimeEntry, 'pull_record', classmethod(
+        lambda cls, source, record: mapped.append(record['id']) or pull_record(source, record)))
+
+    def failing_upsert(data):
+        raise ValueError('Disk full')
+
+    monkeypatch.setattr(TimeEntry, 'upsert', staticmethod(failing_upsert))
+
+    with pytest.raises(ValueError):
+        pull(api, [TimeEntry], batch_size=2)
+
+    # No more than the batches that fit in the queue, of 500
+    assert len(mapped) <= 2 * (cache.PENDING_BATCHES + 2)
+
+
+def test_time_entry_pulls_forget_days_a_failed_pull_changed(database, api, freshbooks_data,
+                                                            monkeypatch):
+    pull(api, [TimeEntry])
+    TimeEntry.changed_days.add(datetime.date(2000, 1, 1))
+    freshbooks_data['time_entries'][0]['duration'] *= 2
+
+    refreshed = []
+    monkeypatch.setattr(TimeEntryDay, 'refresh',
+                        classmethod(lambda cls, days=None: refreshed.append(set(days))))
+    pull(api, [TimeEntry])
+
+    assert refreshed
+    assert datetime.date(2000, 1, 1) not in refreshed[0]
+
+
+def test_status_skips_tables_older_caches_lack(database, api, caplog):
+    caplog.set_level(logging.INFO)
+    pull(api, [Client])
+    drop_tables([TimeEntryDay])
+
+    cache.status()
+    cache.show([Client, TimeEntryDay])
+
+    assert 'TimeEntryDay: not created yet, pull to create it' in caplog.text
+    assert 'TimeEntryDays' not in caplog.text
+
+
+def test_windowed_time_entry_pull_leaves_the_watermark_alone(database, api):
+    pull(api, ALL_MODELS)
+    watermark = MetaData.get_sync_watermark(TimeEntry, 1)
+    last_pulled = MetaData.get_last_pulled_time(TimeEntry)
+
+    client = Client.get(Client.id == 10)
+    window = time_entry_window(client, datetime.datetime(2018, 2, 1), None)
+    pull(api, [TimeEntry], window=window)
+
+    assert api.business.time_entry_requests[-1] is None
+    assert api.business.time_entry_filters[-1] == {
+        'client_id': 10,
+        'started_from': utc_from_local_datetime(datetime.datetime(2018, 2, 1)),
+    }
+    assert MetaData.get_sync_watermark(TimeEntry, 1) == watermark
+    assert MetaData.get_last_pulled_time(TimeEntry) == last_pulled
+
+
+def test_pull_skips_unchanged_pages_once_pulled(database, api, freshbooks_data):
+    freshbooks_data['clients_unchanged'] = True
+
+    # Never pulled into this cache
+    assert Client.pull(api) == 1
+
+    MetaData.update_last_pulled_time(Client)
+    assert Client.pull(api) == 0
+    assert Client.pull(api, full=True) == 1
+
+
+def test_failed_pull_leaves_the_pages_it_fetched_to_fetch_again(database, tmpdir,
+                                                               monkeypatch):
+    clients = [{'id': 10, 'fname': 'Ada', 'lname': 'Lovelace',
+                'organization': 'Engines', 'email': ''}]
+
+    with FakeFreshbooks() as server:
+        server.add_business(1, 'abc', 'Business')
+        server.add_records(Urls.CLIENTS, 'clients', clients, ACCOUNT_ID='abc')
+        api = Api(server.session(), http_cache=DiskCache(str(tmpdir.join('http'))))
+
+        pull(api, [Client])
+        clients[0]['organization'] = 'Looms'
+
+        def failing_upsert(data):
+            raise ValueError('Disk full')
+
+        monkeypatch.setattr(Client, 'upsert', staticmethod(failing_upsert))
+        with pytest.raises(ValueError):
+            pull(api, [Client])
+
+        monkeypatch.undo()
+        pull(api, [Client])
+
+    assert Client.get(Client.id == 10).organization == 'Looms'
+
+
+def test_pull_writes_only_records_that_changed(database, api, freshbooks_data, monkeypatch):
+    assert pull(api, [TimeEntry])['changed']['TimeEntry'] == 5
+
+    pulled = pull(api, [TimeEntry])
+    assert pulled['changed'] == {'Client': 0, 'Project': 0, 'Task': 0, 'TimeEntry': 0,
+                                 'Account': 0, 'Business': 0}
+    assert pulled['unchanged']['TimeEntry'] == 5
+
+    # Entry 3 shares its page with entry 4, which is not even mapped again
+    freshbooks_data['time_entries'][2]['duration'] = 7200
+
+    mapped = []
+    pull_record = TimeEntry.pull_record
+    monkeypatch.setattr(TimeEntry, 'pull_record', classmethod(
+        lambda cls, source, record: mapped.append(record['id']) or pull_record(source, record)))
+
+    pulled = pull(api, [TimeEntry])
+    assert (pulled['changed']['TimeEntry'], pulled['unchanged']['TimeEntry']) == (1, 4)
+    assert mapped == [3]
+    assert TimeEntry.get(TimeEntry.id == 3).duration == 7200
+
+    # Full pulls map and compare every record, but still only write changes
+    pulled = pull(api, [TimeEntry], full=True)
+    assert (pulled['changed']['TimeEntry'], pulled['unchanged']['TimeEntry']) == (0, 5)
+
+
+@pytest.mark.parametrize('sqlite_upsert', [True, False])
+def test_upsert_counts_rows_inserted_updated_and_unchanged(database, monkeypatch,
+                                                           sqlite_upsert):
+    monkeypatch.setattr(models, 'SQLITE_UPSERT', sqlite_upsert)
+
+    Account.upsert([{'id': 'abc'}])
+    rows = [{'id': id, 'account': 'abc', 'fname': 'Ada', 'lname': 'Lovelace',
+             'organization': 'Client %s' % id, 'email': ''} for id in (10, 11, 12)]
+
+    assert Client.upsert(rows) == {'inserted': 3, 'updated': 0, 'unchanged': 0}
+
+    rows[1]['email'] = 'ada@example.com'
+    rows.append(dict(rows[2], organization='Renamed'))
+    assert Client.upsert(rows) == {'inserted': 0, 'updated': 2, 'unchanged': 1}
+
+    clients = Client.select().order_by(Client.id)
+    assert [(client.organization, client.email) for client in clients] == [
+        ('Client 10', ''), ('Client 11', 'ada@example.com'), ('Renamed', '')]
+
+    assert Account.upsert([{'id': 'abc'}, {'id': 'def'}]) == {
+        'inserted': 1, 'updated': 0, 'unchanged': 1}
+
+
+def test_cache_is_opened_in_wal_mode(database):
+    assert database.pragma('journal_mode') == ('wal',)
+    assert database.pragma('synchronous') == (1,)
+
+
+def test_read_only_connections_refuse_writes(database, api):
+    pull(api, [Client])
+    database.configure(read_only=True)
+
+    try:
+        assert Client.select().count() == 1
+
+        with pytest.raises(OperationalError):
+            Client.create(id=11, organization='Looms')
+    finally:
+        database.configure(read_only=False)
+
+
+def test_pull_commits_batches_readers_can_see(database, api, monkeypatch):
+    pull(api, [Client, Project, Task])
+    monkeypatch.setattr(cache, 'COMMIT_BATCHES', 1)
+
+    reader = sqlite3.connect(database.database, timeout=0)
+    visible = []
+    upsert = TimeEntry.upsert
+
+    def counting_upsert(data):
+        visible.append(reader.execute('SELECT COUNT(*) FROM timeentry').fetchone()[0])
+        return upsert(data)
+
+    monkeypatch.setattr(TimeEntry, 'upsert', staticmethod(counting_upsert))
+    pull(api, [TimeEntry], batch_size=2)
+    reader.close()
+
+    assert visible == [0, 2, 4]
+
+
+def test_pull_commits_entries_with_their_rollup(database, api, freshbooks_data, monkeypatch):
+    pull(api, [TimeEntry])
+    monkeypatch.setattr(cache, 'COMMIT_BATCHES', 1)
+
+    for entry in freshbooks_data['time_entries']:
+        entry['duration'] *= 2
+
+    reader = sqlite3.connect(database.database, timeout=0)
+    totals = []
+    upsert = TimeEntry.upsert
+
+    def checking_upsert(data):
+        totals.append((
+            reader.execute('SELECT SUM(duration) FROM timeentry').fetchone()[0],
+            reader.execute('SELECT SUM(duration) FROM timeentryday').fetchone()[0]))
+        return upsert(data)
+
+    monkeypatch.setattr(TimeEntry, 'upsert', staticmethod(checking_upsert))
+    pull(api, [TimeEntry], batch_size=2)
+    reader.close()
+
+    assert totals == [(18000, 18000), (25200, 25200), (32400, 32400)]
+
+
+def test_interrupted_pull_leaves_the_rollup_adding_up(database, api, freshbooks_data,
+                                                      monkeypatch):
+    for day, entry in enumerate(freshbooks_data['time_entries'], 1):
+        entry['started_at'] = '2018-02-%02dT15:00:00Z' % day
+
+    pull(api, [TimeEntry])
+    monkeypatch.setattr(cache, 'COMMIT_BATCHES', 1)
+
+    for entry in freshbooks_data['time_entries']:
+        entry['duration'] *= 2
+
+    written = []
+    write_batch = TimeEntry.write_batch
+
+    def failing_write(batch):
+        if written:
+            raise ValueError('Disk full')
+        written.append(batch)
+        return write_batch(batch)
+
+    monkeypatch.setattr(TimeEntry, 'write_batch', staticmethod(failing_write))
+    with pytest.raises(ValueError):
+        pull(api, [TimeEntry], batch_size=2)
+
+    del written[:]
+    with pytest.raises(ValueError):
+        TimeEntry.pull(api, batch_size=2)
+
+    monkeypatch.undo()
+    pull(api, [TimeEntry], batch_size=2)
+
+    totals = [TimeEntry.select(fn.Sum(TimeEntry.duration)).scalar(),
+              TimeEntryDay.select(fn.Sum(TimeEntryDay.duration)).scalar()]
+    assert totals == [36000, 36000]
+
+
+def test_time_entry_upserts_only_change_the_days_they_write(database, api, freshbooks_data,
+                                                            monkeypatch):
+    for day, entry in enumerate(freshbooks_data['time_entries'], 1):
+        entry['started_at'] = '2018-02-%02dT15:00:00Z' % day
+
+    pull(api, [TimeEntry])
+    freshbooks_data['time_entries'][2]['duration'] = 7200
+    freshbooks_data['time_entries'][3]['started_at'] = '2018-03-01T15:00:00Z'
+
+    refreshed = []
+    monkeypatch.setattr(TimeEntryDay, 'refresh',
+                        classmethod(lambda cls, days=None: refreshed.append(set(days))))
+
+    # Past the digests, so every entry is upserted again
+    pull(api, [TimeEntry], full=True)
+
+    assert refreshed == [set([datetime.date(2018, 2, 3), datetime.date(2018, 2, 4),
+                              datetime.date(2018, 3, 1)])]
+
+
+def test_model_dependency_levels():
+    levels = model_dependency_levels([TimeEntry, TaskLog])
+
+    assert levels[-2:] == [[TimeEntry], [TaskLog]]
+    assert set(levels[0]) == set([Account, Task, LogDestination])
+    assert Project in levels[2] and Client in levels[1]
@@ -0,0 +1,32 @@
+import refresh2.transport
+
+from freshtools.models import db, ALL_MODELS
+from freshtools.cache import pull
+from freshtools.profiling import Profile, phase
+
+
+def test_profile_breaks_a_pull_down_by_phase(database, api):
+    profile = Profile(db()).start()
+
+    pull(api, ALL_MODELS)
+    refresh2.transport.notify('request', 0.25, size=1000, status=200)
+
+    profile.stop()
+    report = profile.report()
+
+    assert report['phases']['upsert']['rows'] > 0
+    assert report['phases']['date bucketing']['rows'] == 5
+    assert report['sql']['INSERT']['statements'] > 0
+    assert report['http']['requests'] == 1
+    assert report['http']['bytes'] == 1000
+    assert report['http']['p50'] == 0.25
+
+
+def test_profiling_stops_cleanly(database):
+    Profile(db()).start().stop()
+
+    assert 'execute_sql' not in vars(db())
+    assert refresh2.transport.listeners == []
+
+    with phase('ignored'):
+        pass
@@ -0,0 +1,39 @@
+import pytest
+
+numpy = pytest.importorskip('numpy')
+
+from freshtools.entries import time_entry_window
+from freshtools.models import MetaData, TimeEntry
+from freshtools.snapshot import write_snapshot, current_snapshot
+from freshtools.summary import WeeksByClientProject, MonthsByClientProject, YearsByClientProject
+
+
+def test_snapshot_is_only_used_while_current(history):
+    assert current_snapshot() is None
+
+    write_snapshot()
+    snapshot = current_snapshot()
+
+    assert snapshot is not None
+    assert len(snapshot.frame) == TimeEntry.select().count()
+    assert snapshot.clients[11] == 'Difference'
+
+    MetaData.update_last_pulled_time(TimeEntry)
+    assert current_snapshot() is None
+
+
+@pytest.mark.parametrize('summary', [
+    WeeksByClientProject,
+    MonthsByClientProject,
+    YearsByClientProject,
+])
+def test_snapshot_records_match_sql_records(history, summary):
+    write_snapshot()
+    window = time_entry_window(start_date='2018-02-01', end_date='2018-10-31')
+
+    mapped, report = summary(window), summary(window)
+    report.use_snapshot = False
+
+    assert current_snapshot() is not None
+
+    assert list(mapped.records()) == list(report.records())
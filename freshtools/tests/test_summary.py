@@ -0,0 +1,172 @@
+import csv
+import json
+import pytest
+from peewee import fn
+from playhouse.test_utils import count_queries
+
+from freshtools.cache import pull
+from freshtools.entries import time_entry_window
+from freshtools.export import export
+from freshtools.indexes import explain
+from freshtools.models import TimeEntry, TimeEntryDay
+from freshtools.summary import (ALL_SUMMARIES, TasksByClient, DaysByClientProjectTask,
+                                WeeksByClientProject, MonthsByClientProject,
+                                YearsByClientProject, TimePeriodByClientProject)
+
+from conftest import time_entry
+
+
+def rollup_checks(summary):
+    # Period summaries also check, once, whether the rollup is built
+    with count_queries() as checks:
+        if issubclass(summary, TimePeriodByClientProject):
+            TimeEntryDay.is_current()
+
+    return checks.count
+
+
+@pytest.mark.parametrize('summary', [
+    TasksByClient,
+    DaysByClientProjectTask,
+    WeeksByClientProject,
+    MonthsByClientProject,
+    YearsByClientProject,
+])
+def test_summary_runs_a_constant_number_of_queries(history, summary):
+    lines = []
+    window = time_entry_window(start_date='2018-01-01', end_date='2018-12-31')
+
+    with count_queries() as counter:
+        summary(window).print_report(lines.append)
+
+    assert counter.count == rollup_checks(summary) + 1
+    assert 'Engines' in '\n'.join(lines)
+    assert 'Difference' in '\n'.join(lines)
+
+
+@pytest.mark.parametrize('summary', [
+    DaysByClientProjectTask,
+    WeeksByClientProject,
+    MonthsByClientProject,
+    YearsByClientProject,
+])
+def test_summary_groups_stream_out_in_period_order(history, summary):
+    window = time_entry_window(start_date='2018-01-01', end_date='2018-12-31')
+    report = summary(window)
+
+    titles = [report.format_title(group) for group in report.query_set()]
+
+    assert titles
+    assert titles == sorted(set(titles))
+
+
+@pytest.mark.parametrize('summary', ALL_SUMMARIES)
+def test_summary_windows_search_an_index(database, summary):
+    window = time_entry_window(start_date='2018-01-01', end_date='2018-12-31')
+    plan = [row[-1] for row in explain(summary(window).query())]
+
+    assert any('SEARCH' in step and 'USING INDEX timeentry_' in step for step in plan)
+
+
+def test_summary_groupings_are_covered_by_an_index(database):
+    query = TimeEntry.select(
+        TimeEntry.started_at_week_ending_date,
+        TimeEntry.client,
+        TimeEntry.project,
+        fn.Sum(TimeEntry.duration),
+        fn.Max(TimeEntry.billed),
+        fn.Min(TimeEntry.started_at),
+    ).where(
+        TimeEntry.started_at >= '2018-01-01'
+    ).group_by(
+        TimeEntry.started_at_week_ending_date,
+        TimeEntry.client,
+        TimeEntry.project,
+    )
+    plan = [row[-1] for row in explain(query)]
+
+    assert any('USING COVERING INDEX timeentry_' in step for step in plan)
+
+
+def report_lines(report, use_rollup):
+    lines = []
+    report.use_rollup = use_rollup
+    report.print_report(lines.append)
+    return lines
+
+
+@pytest.mark.parametrize('summary', [
+    WeeksByClientProject,
+    MonthsByClientProject,
+    YearsByClientProject,
+])
+def test_rollup_reports_match_time_entry_reports(history, api, freshbooks_data, summary):
+    window = time_entry_window(start_date='2018-02-01', end_date='2018-10-31')
+
+    # Move an entry to another day, and make sure the old day is refreshed
+    moved = freshbooks_data['time_entries'][0]
+    moved['started_at'] = '2018-07-04T12:00:00Z'
+    freshbooks_data['time_entries'] = [moved]
+    pull(api, [TimeEntry])
+
+    rolled_up = report_lines(summary(window), True)
+
+    assert TimeEntryDay.is_current()
+    assert 'Engines' in '\n'.join(rolled_up)
+    assert rolled_up == report_lines(summary(window), False)
+
+
+@pytest.mark.parametrize('summary', ALL_SUMMARIES)
+def test_summary_exports_stream_records(history, tmpdir, summary):
+    window = time_entry_window(start_date='2018-01-01', end_date='2018-12-31')
+    report = summary(window)
+    csv_path, jsonl_path = str(tmpdir.join('report.csv')), str(tmpdir.join('report.jsonl'))
+
+    with count_queries() as counter:
+        export(report, 'csv', csv_path)
+    export(report, 'jsonl', jsonl_path)
+
+    with open(csv_path) as exported:
+        rows = list(csv.DictReader(exported))
+    with open(jsonl_path) as exported:
+        records = [json.loads(line) for line in exported]
+
+    assert counter.count == rollup_checks(summary) + 1
+    assert len(rows) == len(records) > 0
+    assert [row['client'] for row in rows] == [record['client'] for record in records]
+    assert sum(record['hours'] for record in records) == 59
+
+
+@pytest.mark.parametrize('summary', [
+    WeeksByClientProject,
+    MonthsByClientProject,
+    YearsByClientProject,
+])
+def test_rollup_records_match_time_entry_records(history, summary):
+    window = time_entry_window(start_date='2018-02-01', end_date='2018-10-31')
+    rolled_up, report = summary(window), summary(window)
+    report.use_rollup = False
+
+    assert rolled_up.use_rollup
+    assert list(rolled_up.records()) == list(report.records())
+
+
+def test_day_reports_and_exports_agree_on_billed(database, api, freshbooks_data, tmpdir):
+    # Only the middle entry of the day, by id and by time, was billed
+    entries = [time_entry(id, started_at='2018-02-14T%02d:00:00Z' % hour)
+               for id, hour in [(1, 9), (2, 12), (3, 15)]]
+    entries[1]['billed'] = True
+    freshbooks_data['time_entries'] = entries
+    pull(api, [TimeEntry])
+
+    window = time_entry_window(start_date='2018-02-01', end_date='2018-02-28')
+    lines = []
+    DaysByClientProjectTask(window).print_report(lines.append)
+    jsonl_path = str(tmpdir.join('report.jsonl'))
+    export(DaysByClientProjectTask(window), 'jsonl', jsonl_path)
+
+    with open(jsonl_path) as exported:
+        record, = [json.loads(line) for line in exported]
+
+    assert 'Billed: Yes' in '\n'.join(lines)
+    assert record['billed']
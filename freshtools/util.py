@@ -1,3 +1,4 @@
+import operator
 import itertools
 import collections
 from peewee import *
@@ -24,6 +25,16 @@ def lookahead(iterable):
     yield last, False
 
 
+def chunked(iterable, size):
+    it = iter(iterable)
+
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def coalate(rows, by=[]):
     if not by:
         return rows
@@ -46,6 +57,19 @@ def coalate(rows, by=[]):
     return coalated
 
 
+def grouped(rows, by):
+    """
+    Streams rows sorted by the `by` keys out in groups: yields the coalation
+    of each run of rows that share the first key, so that only one group is
+    held in memory at a time.
+    """
+    for _, group in itertools.groupby(rows, key=operator.attrgetter(by[0])):
+        if len(by) > 1:
+            yield coalate(group, by=by[1:])
+        else:
+            yield list(group)
+
+
 def get_immediate_dependencies(model):
     dependencies = []
 
@@ -75,6 +99,27 @@ def model_dependency_order(models):
     return topo_sort(models, set())
 
 
+def model_dependency_levels(models):
+    """
+    Groups models so that every model only depends on models in earlier
+    groups.  Models in the same group do not depend on each other.
+    """
+    levels = collections.OrderedDict()
+
+    for model in model_dependency_order(models):
+        dependency_levels = [
+            levels[dependency] for dependency in get_immediate_dependencies(model)
+            if dependency in levels]
+
+        levels[model] = max(dependency_levels) + 1 if dependency_levels else 0
+
+    grouped = [[] for _ in set(levels.values())]
+    for model, level in levels.items():
+        grouped[level].append(model)
+
+    return grouped
+
+
 def create_tables(models):
     for model in models:
         if not model.table_exists():
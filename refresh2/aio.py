@@ -0,0 +1,135 @@
+"""
+asyncio front end to refresh2, for services that sync many accounts from
+one event loop:
+
+    pool = AsyncPool()
+    api = AsyncApi(session, pool=pool)
+    business = await api.business(business_id=1)
+
+    async for page in business.time_entry_pages(updated_since=since):
+        ...
+
+Requests are made by the synchronous client on the pool's worker threads,
+so responses go through the same normalize_wonky_response, caching and
+retry handling.  Every AsyncApi on a pool shares its connections, and the
+pool's size caps the number of requests in flight across all of them.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from .api import Api
+from .transport import POOL_SIZE
+
+
+class AsyncPool(object):
+
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        self.adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+        self.executor = ThreadPoolExecutor(max_workers=size)
+
+    def run(self, f, *args, **kwargs):
+        """ Calls f on a worker thread, returning an awaitable future """
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(
+            self.executor, functools.partial(f, *args, **kwargs))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.adapter.close()
+
+
+class AsyncPages(object):
+    """
+    Async iterator over the pages of a synchronous page generator, which
+    is advanced on the pool's worker threads.
+    """
+
+    def __init__(self, pool, pages):
+        self.pool = pool
+        self.pages = pages
+        self._lock = threading.Lock()
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self.pool.run(self._next_page)
+
+    def aclose(self):
+        return self.pool.run(self._close)
+
+    def _next_page(self):
+        with self._lock:
+            try:
+                return next(self.pages)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    def _close(self):
+        # A generator can't be closed while another worker is running it
+        with self._lock:
+            self.pages.close()
+
+
+class AsyncAccountApi(object):
+
+    def __init__(self, api, account):
+        self.api = api
+        self.account = account
+        self.info = account.info
+
+    def client_pages(self, *args, **kwargs):
+        return AsyncPages(self.api.pool, self.account.client_pages(*args, **kwargs))
+
+    def task_pages(self, *args, **kwargs):
+        return AsyncPages(self.api.pool, self.account.task_pages(*args, **kwargs))
+
+
+class AsyncBusinessApi(object):
+
+    def __init__(self, api, business):
+        self.api = api
+        self.business = business
+        self.info = business.info
+
+    def account(self):
+        return AsyncAccountApi(self.api, self.business.account())
+
+    def time_entry_pages(self, *args, **kwargs):
+        return AsyncPages(self.api.pool, self.business.time_entry_pages(*args, **kwargs))
+
+    def project_pages(self, *args, **kwargs):
+        return AsyncPages(self.api.pool, self.business.project_pages(*args, **kwargs))
+
+
+class AsyncApi(object):
+
+    def __init__(self, session, pool=None, **options):
+        if pool is None:
+            pool = AsyncPool()
+
+        self.pool = pool
+        self.api = Api(session, adapter=pool.adapter, **options)
+
+    def test(self):
+        return self.pool.run(self.api.test)
+
+    def identity(self):
+        return self.pool.run(self.api.identity)
+
+    def businesses(self):
+        return self.pool.run(
+            lambda: [AsyncBusinessApi(self, business)
+                     for business in self.api.businesses()])
+
+    def business(self, business_name=None, business_id=None):
+        return self.pool.run(
+            lambda: AsyncBusinessApi(self, self.api.business(
+                business_name=business_name, business_id=business_id)))
+
+    def cache_stats(self):
+        return self.api.cache_stats()
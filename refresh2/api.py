@@ -1,11 +1,20 @@
 import json
-import urllib
-from util import classproperty, memoize, safe_get, pretty
-from exceptions import *
+import time
+import itertools
+import collections
+from multiprocessing.pool import ThreadPool
+from .util import classproperty, memoize, safe_get, pretty, format_datetime
+from .cache import ResponseCache
+from .httpcache import validator_headers
+from .transport import Transport, POOL_SIZE, TIMEOUT, RETRIES, notify
+from .exceptions import *
 
 USER_AGENT = 'refresh2 (python) 1.0'
 VERSION = 'alpha'
 PAGE_SIZE = 100
+CONCURRENCY = 1
+CACHE_TTL = 300
+NOT_MODIFIED = 304
 
 
 class Urls:
@@ -24,6 +33,10 @@ class Urls:
     TASKS = 'https://api.freshbooks.com/accounting/account/{ACCOUNT_ID}/projects/tasks'
 
 
+def is_error_response(response):
+    return 'message' in response or 'errors' in response
+
+
 def normalize_wonky_response(url, response):
     # Deal with hodge-podge freshbook api response...
 
@@ -55,27 +68,111 @@ def normalize_wonky_response(url, response):
     return pagination, result
 
 
-def paginated_get(api, url, key=None, page_size=PAGE_SIZE, **kwargs):
-    current_page = 1
+def select_key(result, key):
+    if key is not None:
+        return safe_get(result, key)
+    else:
+        return result
+
+
+class UnchangedPage(object):
+    """
+    A page the server answered with 304 Not Modified.  Its records are only
+    decoded from the cached copy if somebody iterates over them.
+    """
+    unchanged = True
 
-    while True:
-        kwargs.update({
-            'per_page': page_size,
-            'page': current_page,
-        })
+    def __init__(self, url, body, key):
+        self.url = url
+        self.body = body
+        self.key = key
+        self._records = None
+
+    @property
+    def records(self):
+        if self._records is None:
+            _, result = normalize_wonky_response(self.url, json.loads(self.body))
+            self._records = select_key(result, self.key)
+
+        return self._records
+
+    def __iter__(self):
+        return iter(self.records)
 
-        response = api.get(url, **kwargs)
+    def __len__(self):
+        return len(self.records)
+
+
+class CachedPage(list):
+    """
+    A page the server sent along with validators.  They only go into the
+    http_cache once whoever saves the page's records calls store(), so
+    that a pull failing before then gets the page in full next time,
+    rather than being told it did not change.
+    """
+    unchanged = False
+
+    def __init__(self, records, store):
+        super(CachedPage, self).__init__(records)
+        self.store = store
+
+
+def paginated_get(api, url, key=None, page_size=None, concurrency=None,
+                  cached=False, **kwargs):
+    """
+    Yields every page of a paginated endpoint.  With cached=True, pages go
+    through the api's on-disk http_cache, and pages that did not change
+    since they were cached come back as UnchangedPage.
+    """
+    if page_size is None:
+        page_size = api.page_size
+    if concurrency is None:
+        concurrency = api.concurrency
+
+    def get_page(page):
+        params = dict(kwargs, per_page=page_size, page=page)
+
+        if cached:
+            return api.get_cached(url, key, **params)
+
+        response = api.get(url, **params)
         pagination, result = normalize_wonky_response(url, response)
 
-        if key is not None:
-            yield safe_get(result, key)
-        else:
+        return pagination, select_key(result, key)
+
+    pagination, result = get_page(1)
+    yield result
+
+    if not pagination:
+        return
+
+    remaining = range(pagination['page'] + 1, pagination['pages'] + 1)
+
+    if concurrency <= 1 or len(remaining) <= 1:
+        for page in remaining:
+            _, result = get_page(page)
             yield result
+        return
+
+    # Keep at most `concurrency` pages in flight, and hand them out in
+    # page order no matter which one comes back first.
+    pool = ThreadPool(min(concurrency, len(remaining)))
+    pages = iter(remaining)
+    in_flight = collections.deque()
 
-        if not pagination or current_page == pagination['pages']:
-            break
+    try:
+        for page in itertools.islice(pages, concurrency):
+            in_flight.append(pool.apply_async(get_page, (page,)))
 
-        current_page = pagination['page'] + 1
+        while in_flight:
+            _, result = in_flight.popleft().get()
+
+            for page in itertools.islice(pages, 1):
+                in_flight.append(pool.apply_async(get_page, (page,)))
+
+            yield result
+    finally:
+        pool.terminate()
 
 
 def non_paginated_get(api, url, key=None, **kwargs):
@@ -100,14 +197,17 @@ class AccountApi(object):
             'id': account_id
         }
 
-    def client_pages(self, client=None):
+    def client_pages(self, client=None, client_id=None):
         kwargs = {}
 
         if client is not None:
             kwargs['search[user_like]'] = client
             kwargs['search[email_like]'] = client
 
-        return paginated_get(self, Urls.CLIENTS, key='clients')
+        if client_id is not None:
+            kwargs['search[userid]'] = client_id
+
+        return paginated_get(self, Urls.CLIENTS, key='clients', cached=True, **kwargs)
 
     def task_pages(self, task_id=None):
         kwargs = {}
@@ -115,12 +215,24 @@ class AccountApi(object):
         if task_id is not None:
             kwargs['search[taskid]'] = task_id
 
-        return paginated_get(self, Urls.TASKS, key='tasks')
+        return paginated_get(self, Urls.TASKS, key='tasks', cached=True, **kwargs)
+
+    @property
+    def page_size(self):
+        return self.api.page_size
+
+    @property
+    def concurrency(self):
+        return self.api.concurrency
 
     def get(self, url, **kwargs):
         return self.api.get(
             url.format(ACCOUNT_ID=self.info['id']), **kwargs)
 
+    def get_cached(self, url, key=None, **kwargs):
+        return self.api.get_cached(
+            url.format(ACCOUNT_ID=self.info['id']), key, **kwargs)
+
 
 class BusinessApi(object):
 
@@ -131,25 +243,69 @@ class BusinessApi(object):
     def account(self):
         return AccountApi(self.api, self.info['account_id'])
 
-    def time_entry_pages(self, client_id=None):
+    def time_entry_pages(self, client_id=None, updated_since=None,
+                         started_from=None, started_to=None):
         kwargs = {}
 
         if client_id is not None:
             kwargs['client_id'] = client_id
 
-        return paginated_get(self, Urls.TIME_ENTRIES, key='time_entries')
+        if updated_since is not None:
+            kwargs['updated_since'] = format_datetime(updated_since)
+
+        if started_from is not None:
+            kwargs['started_from'] = format_datetime(started_from)
 
-    def project_pages(self):
-        return paginated_get(self, Urls.PROJECTS, key='projects')
+        if started_to is not None:
+            kwargs['started_to'] = format_datetime(started_to)
+
+        return paginated_get(self, Urls.TIME_ENTRIES, key='time_entries', **kwargs)
+
+    def project_pages(self, client_id=None):
+        kwargs = {}
+
+        if client_id is not None:
+            kwargs['client_id'] = client_id
+
+        return paginated_get(self, Urls.PROJECTS, key='projects', cached=True, **kwargs)
+
+    @property
+    def page_size(self):
+        return self.api.page_size
+
+    @property
+    def concurrency(self):
+        return self.api.concurrency
 
     def get(self, url, **kwargs):
         return self.api.get(
             url.format(BUSINESS_ID=self.info['id']), **kwargs)
 
+    def get_cached(self, url, key=None, **kwargs):
+        return self.api.get_cached(
+            url.format(BUSINESS_ID=self.info['id']), key, **kwargs)
+
 
 class Api(object):
-    def __init__(self, session):
+    # Identity and business membership data hardly ever changes, and is
+    # needed by almost every call.  Everything else always goes out.
+    cached_urls = (Urls.IDENTITY,)
+
+    def __init__(self, session, page_size=PAGE_SIZE, concurrency=CONCURRENCY,
+                 cache_ttl=CACHE_TTL, timeout=TIMEOUT, retries=RETRIES,
+                 http_cache=None, adapter=None):
         self.session = session
+        self.page_size = page_size
+        self.concurrency = concurrency
+        self.cache_ttl = cache_ttl
+        self.cache = ResponseCache()
+        self.http_cache = http_cache
+        self.transport = Transport(
+            session,
+            pool_size=max(POOL_SIZE, concurrency),
+            timeout=timeout,
+            retries=retries,
+            adapter=adapter)
         self.update_headers(self.session)
 
     def test(self):
@@ -183,8 +339,70 @@ class Api(object):
         return BusinessApi(self, info)
 
     def get(self, url, **kwargs):
-        res = self.session.get(url, params=kwargs)
-        return res.json()
+        key = (url, tuple(sorted(kwargs.items())))
+        ttl = self.cache_ttl if url in self.cached_urls else 0
+
+        response = self.cache.get(
+            key, lambda: self._get(url, kwargs), ttl=ttl)
+
+        if ttl and is_error_response(response):
+            self.cache.invalidate(key)
+
+        return response
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+    def get_cached(self, url, key=None, **kwargs):
+        """
+        GETs a page through the on-disk http_cache, asking the server for it
+        only if it changed since it was cached.  Returns (pagination, result)
+        like a normalized response, where result is an UnchangedPage when
+        the server answered 304 Not Modified, and a CachedPage when it sent
+        validators to keep for next time.
+        """
+        if self.http_cache is None:
+            pagination, result = normalize_wonky_response(url, self.get(url, **kwargs))
+            return pagination, select_key(result, key)
+
+        cache_key = self.http_cache.key(url, kwargs)
+        entry = self.http_cache.get(cache_key)
+        headers = validator_headers(entry) if entry is not None else None
+
+        res = self.transport.get(url, params=kwargs, headers=headers)
+
+        if res.status_code == NOT_MODIFIED and entry is not None:
+            return entry['pagination'], UnchangedPage(url, entry['body'], key)
+
+        pagination, result = normalize_wonky_response(url, self._decode(url, res))
+        records = select_key(result, key)
+
+        etag = res.headers.get('ETag')
+        last_modified = res.headers.get('Last-Modified')
+
+        if (etag or last_modified) and isinstance(records, list):
+            entry = {
+                'etag': etag,
+                'last_modified': last_modified,
+                'pagination': pagination,
+                'body': res.text,
+            }
+            records = CachedPage(
+                records, lambda: self.http_cache.put(cache_key, entry))
+
+        return pagination, records
+
+    def _get(self, url, params):
+        return self._decode(url, self.transport.get(url, params=params))
+
+    def _decode(self, url, res):
+        try:
+            started = time.time()
+            document = res.json()
+            notify('decode', time.time() - started)
+            return document
+        except ValueError:
+            raise ApiError('Unexpected HTTP %s response: %s' % (res.status_code, url))
 
     @classmethod
     def update_headers(cls, session):
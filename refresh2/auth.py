@@ -5,7 +5,7 @@ import webbrowser
 from flask import Flask, request, session, redirect
 from requests_oauthlib import OAuth2Session
 
-import api
+from . import api
 
 
 class TokenStore(object):
@@ -21,7 +21,7 @@ class TokenStore(object):
         try:
             with open(self.filename, 'r') as store:
                 return json.load(store)
-        except IOError, ex:
+        except IOError:
             return None
 
 
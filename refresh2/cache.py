@@ -0,0 +1,90 @@
+import time
+import threading
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+
+        if self.error is not None:
+            raise self.error
+
+        return self.result
+
+
+class ResponseCache(object):
+    """
+    Keeps responses around for a while, and collapses identical requests
+    that are in flight at the same time into a single round trip.
+
+    hits:   requests answered from the cache
+    misses: cacheable requests that had to go out
+    shared: requests that waited on an identical request already in flight
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+        self._entries = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch, ttl=0):
+        with self._lock:
+            if ttl > 0:
+                entry = self._entries.get(key)
+
+                if entry is not None and entry[0] > time.time():
+                    self.hits += 1
+                    return entry[1]
+
+            call = self._in_flight.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._in_flight[key] = _Call()
+
+                if ttl > 0:
+                    self.misses += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            return call.wait()
+
+        try:
+            call.result = fetch()
+        except Exception as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                if call.error is None and ttl > 0:
+                    self._entries[key] = (time.time() + ttl, call.result)
+
+                del self._in_flight[key]
+
+            call.done.set()
+
+        return call.result
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared': self.shared,
+        }
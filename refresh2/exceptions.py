@@ -6,6 +6,10 @@ class ApiError(Exception):
     pass
 
 
+class TransportError(ApiError):
+    pass
+
+
 class BusinessNotFound(Exception):
     pass
 
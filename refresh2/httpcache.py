@@ -0,0 +1,141 @@
+import os
+import json
+import errno
+import hashlib
+import threading
+
+try:
+    from urllib import urlencode
+except ImportError:
+    from urllib.parse import urlencode
+
+# Upper bound on the size of the cache directory
+MAX_BYTES = 50 * 1024 * 1024
+
+# Fraction of MAX_BYTES the cache is evicted down to once it is full
+EVICT_TO = 0.9
+
+
+class DiskCache(object):
+    """
+    Keeps responses on disk, keyed by URL and query parameters, along with
+    the ETag and Last-Modified validators the server sent with them.
+    The least recently used entries are evicted once the cache grows
+    past max_bytes, until it is back under EVICT_TO of it.
+    """
+
+    def __init__(self, directory, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        # Bytes in the directory, counted when it is first written to and
+        # kept up to date from there, so that it is only listed again when
+        # it looks full.  Other processes' writes show up at that point.
+        self._size = None
+
+        try:
+            os.makedirs(directory)
+        except OSError as ex:
+            if ex.errno != errno.EEXIST:
+                raise
+
+    def key(self, url, params):
+        query = urlencode(sorted(params.items()))
+        return hashlib.sha1((url + '?' + query).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        path = self._path(key)
+
+        try:
+            with open(path, 'rb') as entry:
+                cached = json.load(entry)
+        except (IOError, ValueError):
+            return None
+
+        # Reads count as use, for eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return cached
+
+    def put(self, key, entry):
+        path = self._path(key)
+        temp = '%s.%s.tmp' % (path, threading.current_thread().ident)
+
+        with open(temp, 'w') as out:
+            json.dump(entry, out)
+
+        size = os.path.getsize(temp)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+
+        os.rename(temp, path)
+
+        with self._lock:
+            if self._size is not None:
+                self._size += size - replaced
+
+            if self._size is None or self._size > self.max_bytes:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            for name in os.listdir(self.directory):
+                os.remove(os.path.join(self.directory, name))
+
+            self._size = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _evict(self):
+        # Called with the lock held
+        entries = []
+        total = 0
+
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+
+        # Evicting a little more than needed leaves room for the next puts,
+        # rather than listing the directory again on every one of them
+        if total > self.max_bytes:
+            for _, size, path in entries:
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+                total -= size
+
+        self._size = total
+
+
+def validator_headers(entry):
+    headers = {}
+
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    return headers
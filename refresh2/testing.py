@@ -0,0 +1,196 @@
+import json
+import time
+import hashlib
+import collections
+import threading
+import requests
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qsl
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qsl
+
+from .api import Urls
+
+API_HOST = 'https://api.freshbooks.com'
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeFreshbooks(object):
+    """
+    A local stand-in for the Freshbooks API, for tests.  It serves the
+    identity document and paginated listings of canned records, in the same
+    hodge-podge shapes the real API uses.
+
+        with FakeFreshbooks() as server:
+            server.add_business(1, 'abc', 'Business')
+            server.add_records(Urls.TIME_ENTRIES, 'time_entries', entries,
+                               BUSINESS_ID=1)
+            api = Api(server.session())
+
+    Listings are sent with an ETag, and answered 304 Not Modified when a
+    request already has it.
+
+    requests:      (path, params) of every request the server answered
+    delay:         called with (path, params) for the seconds to wait before
+                   answering, e.g. to make pages come back out of order
+    max_in_flight: the most requests the server was answering at once
+
+    queue_response() makes the server answer the next request with a canned
+    response instead, e.g. a 429 with a Retry-After header.
+    """
+
+    def __init__(self):
+        self.memberships = []
+        self.listings = {}
+        self.requests = []
+        self.delay = lambda path, params: 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._canned = collections.deque()
+        self._lock = threading.Lock()
+
+        self._server = _Server(('127.0.0.1', 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%s' % self._server.server_address
+
+    def add_business(self, business_id, account_id, name):
+        self.memberships.append({
+            'business': {
+                'id': business_id,
+                'account_id': account_id,
+                'name': name,
+            }
+        })
+
+    def add_records(self, url, key, records, **ids):
+        path = urlsplit(url.format(**ids)).path
+        self.listings[path] = (key, records)
+
+    def queue_response(self, status, document=None, headers=None):
+        self._canned.append((status, document or {}, headers or {}))
+
+    def session(self):
+        """ A requests session that sends API calls to this server instead """
+        return _RedirectingSession(self.url)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def respond(self, path, params):
+        with self._lock:
+            self.requests.append((path, params))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        try:
+            delay = self.delay(path, params)
+            if delay:
+                time.sleep(delay)
+
+            with self._lock:
+                if self._canned:
+                    return self._canned.popleft()
+
+            status, document = self._document(path, params)
+            return status, document, {}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _document(self, path, params):
+        if path == urlsplit(Urls.IDENTITY).path:
+            return 200, {'response': {'business_memberships': self.memberships}}
+
+        if path not in self.listings:
+            return 404, {'message': 'Not found'}
+
+        key, records = self.listings[path]
+        per_page = int(params.get('per_page', 15))
+        page = int(params.get('page', 1))
+        pages = max(1, (len(records) + per_page - 1) // per_page)
+        start = (page - 1) * per_page
+
+        listing = {
+            key: records[start:start + per_page],
+        }
+        pagination = {
+            'page': page,
+            'pages': pages,
+            'per_page': per_page,
+            'total': len(records),
+        }
+
+        # The accounting endpoints answer in the old style, the rest don't
+        if path.startswith('/accounting/'):
+            listing.update(pagination)
+            return 200, {'response': {'result': listing}}
+
+        listing['meta'] = pagination
+        return 200, listing
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                status, document, headers = server.respond(
+                    parts.path, dict(parse_qsl(parts.query)))
+                body = json.dumps(document, sort_keys=True).encode('utf-8')
+
+                if status == 200 and parts.path in server.listings:
+                    headers = dict(headers, ETag='"%s"' % hashlib.sha1(body).hexdigest())
+
+                    if self.headers.get('If-None-Match') == headers['ETag']:
+                        status, body = 304, b''
+
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class _RedirectingSession(requests.Session):
+
+    def __init__(self, base_url):
+        super(_RedirectingSession, self).__init__()
+        self.base_url = base_url
+
+    def request(self, method, url, *args, **kwargs):
+        if url.startswith(API_HOST):
+            url = self.base_url + url[len(API_HOST):]
+
+        return super(_RedirectingSession, self).request(method, url, *args, **kwargs)
@@ -0,0 +1,101 @@
+import pytest
+
+asyncio = pytest.importorskip('asyncio')
+
+from refresh2.aio import AsyncApi, AsyncPool
+from refresh2.api import Api, Urls
+from refresh2.exceptions import BusinessNotFound
+from refresh2.testing import FakeFreshbooks
+
+
+def time_entries(count):
+    return [{'id': id, 'client_id': 10, 'duration': 60} for id in range(count)]
+
+
+@pytest.fixture
+def server():
+    server = FakeFreshbooks()
+    server.add_business(1, 'abc', 'Business')
+    server.add_records(Urls.TIME_ENTRIES, 'time_entries', time_entries(5), BUSINESS_ID=1)
+    server.add_records(Urls.CLIENTS, 'clients', [{'id': 10}], ACCOUNT_ID='abc')
+
+    with server:
+        yield server
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+def all_pages(loop, pages):
+    # What `async for page in pages` does, without needing the syntax
+    result = []
+
+    while True:
+        try:
+            result.append(loop.run_until_complete(pages.__anext__()))
+        except StopAsyncIteration:
+            return result
+
+
+def test_async_pages_match_sync_pages(server, loop):
+    api = AsyncApi(server.session(), page_size=2)
+    business = loop.run_until_complete(api.business(business_id=1))
+
+    pages = all_pages(loop, business.time_entry_pages())
+    sync_pages = list(Api(server.session(), page_size=2).business(
+        business_id=1).time_entry_pages())
+
+    assert pages == sync_pages
+    assert [len(page) for page in pages] == [2, 2, 1]
+
+
+def test_async_account_pages_are_normalized(server, loop):
+    api = AsyncApi(server.session())
+    business = loop.run_until_complete(api.business(business_name='business'))
+
+    assert all_pages(loop, business.account().client_pages()) == [[{'id': 10}]]
+
+
+def test_apis_on_one_pool_share_connections(server, loop):
+    pool = AsyncPool(size=2)
+    apis = [AsyncApi(server.session(), pool=pool, page_size=1) for _ in range(3)]
+
+    for api in apis:
+        assert api.api.session.get_adapter(server.url) is pool.adapter
+
+    businesses = loop.run_until_complete(asyncio.gather(
+        *[api.business(business_id=1) for api in apis]))
+
+    for business in businesses:
+        assert len(all_pages(loop, business.time_entry_pages())) == 5
+
+    pool.close()
+
+
+def test_async_errors_surface_when_awaited(server, loop):
+    api = AsyncApi(server.session())
+
+    with pytest.raises(BusinessNotFound):
+        loop.run_until_complete(api.business(business_id=2))
+
+
+def test_closing_pages_waits_for_the_page_in_flight(server, loop):
+    server.delay = lambda path, params: 0.2 if 'time_entries' in path else 0
+    pool = AsyncPool(size=2)
+    api = AsyncApi(server.session(), pool=pool, page_size=2)
+    business = loop.run_until_complete(api.business(business_id=1))
+    pages = business.time_entry_pages()
+
+    page, _ = loop.run_until_complete(asyncio.gather(pages.__anext__(), pages.aclose()))
+
+    assert len(page) == 2
+    with pytest.raises(StopAsyncIteration):
+        loop.run_until_complete(pages.__anext__())
+
+    pool.close()
@@ -0,0 +1,70 @@
+import time
+import threading
+
+import pytest
+
+from refresh2.api import Api, Urls
+from refresh2.testing import FakeFreshbooks
+
+TIME_ENTRIES_PATH = '/timetracking/business/1/time_entries'
+
+
+def time_entries(count):
+    return [{'id': id, 'client_id': 10, 'duration': 60} for id in range(count)]
+
+
+@pytest.fixture
+def server():
+    server = FakeFreshbooks()
+    server.add_business(1, 'abc', 'Business')
+    server.add_records(Urls.TIME_ENTRIES, 'time_entries', time_entries(20), BUSINESS_ID=1)
+
+    with server:
+        yield server
+
+
+def page_requests(server):
+    return [params for path, params in server.requests if path == TIME_ENTRIES_PATH]
+
+
+def worker_threads():
+    return [thread for thread in threading.enumerate()
+            if type(thread).__name__ == 'DummyProcess']
+
+
+def test_concurrent_pages_come_in_page_order(server):
+    # Every other page is slow, so later pages finish before earlier ones
+    server.delay = lambda path, params: 0.2 if int(params.get('page', 1)) % 2 == 0 else 0
+
+    business = Api(server.session(), page_size=2, concurrency=4).business(business_id=1)
+    pages = list(business.time_entry_pages())
+
+    assert pages == [time_entries(20)[start:start + 2] for start in range(0, 20, 2)]
+
+
+def test_concurrent_pages_in_flight_are_bounded(server):
+    server.delay = lambda path, params: 0.05
+
+    business = Api(server.session(), page_size=1, concurrency=3).business(business_id=1)
+    pages = list(business.time_entry_pages())
+
+    assert len(pages) == 20
+    assert server.max_in_flight == 3
+
+
+def test_pool_is_shut_down_when_consumer_stops_early(server):
+    server.delay = lambda path, params: 0.05
+    workers = len(worker_threads())
+
+    business = Api(server.session(), page_size=1, concurrency=3).business(business_id=1)
+    pages = business.time_entry_pages()
+
+    next(pages)
+    next(pages)
+    pages.close()
+
+    requested = len(page_requests(server))
+    time.sleep(0.3)
+
+    assert len(page_requests(server)) == requested < 20
+    assert len(worker_threads()) == workers
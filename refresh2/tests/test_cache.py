@@ -0,0 +1,73 @@
+import time
+import threading
+
+import pytest
+
+from refresh2.api import Api
+from refresh2.exceptions import ApiError
+from refresh2.testing import FakeFreshbooks
+
+IDENTITY_PATH = '/auth/api/v1/users/me'
+
+
+@pytest.fixture
+def server():
+    server = FakeFreshbooks()
+    server.add_business(1, 'abc', 'Business')
+
+    with server:
+        yield server
+
+
+def identity_requests(server):
+    return len([path for path, params in server.requests if path == IDENTITY_PATH])
+
+
+def test_identity_is_fetched_once_per_ttl(server):
+    api = Api(server.session(), cache_ttl=0.2)
+
+    for _ in range(3):
+        api.identity()
+
+    assert identity_requests(server) == 1
+    assert api.cache_stats() == {'hits': 2, 'misses': 1, 'shared': 0}
+
+    time.sleep(0.25)
+    api.identity()
+
+    assert identity_requests(server) == 2
+    assert api.cache_stats() == {'hits': 2, 'misses': 2, 'shared': 0}
+
+
+def test_concurrent_identical_gets_share_one_request(server):
+    server.delay = lambda path, params: 0.2
+    api = Api(server.session())
+    results = []
+
+    def get_identity():
+        results.append(api.identity())
+
+    threads = [threading.Thread(target=get_identity) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert identity_requests(server) == 1
+    assert len(results) == 5
+    assert all(result == results[0] for result in results)
+    assert api.cache_stats() == {'hits': 0, 'misses': 1, 'shared': 4}
+
+
+def test_error_documents_are_not_cached(server):
+    server.queue_response(200, {'message': 'Try again later'})
+    api = Api(server.session())
+
+    with pytest.raises(ApiError):
+        api.identity()
+
+    assert api.identity() == {
+        'business_memberships': server.memberships,
+    }
+    assert identity_requests(server) == 2
+    assert api.cache_stats() == {'hits': 0, 'misses': 2, 'shared': 0}
@@ -0,0 +1,58 @@
+import os
+
+import pytest
+
+from refresh2 import httpcache
+from refresh2.api import Api, CachedPage, UnchangedPage, Urls
+from refresh2.httpcache import DiskCache
+from refresh2.testing import FakeFreshbooks
+
+
+@pytest.fixture
+def server():
+    server = FakeFreshbooks()
+    server.add_business(1, 'abc', 'Business')
+    server.add_records(Urls.CLIENTS, 'clients', [{'id': 10}, {'id': 11}], ACCOUNT_ID='abc')
+
+    with server:
+        yield server
+
+
+def client_pages(api):
+    return list(api.business(business_id=1).account().client_pages())
+
+
+def test_validators_are_kept_only_once_the_page_is_stored(server, tmpdir):
+    api = Api(server.session(), http_cache=DiskCache(str(tmpdir)))
+
+    page, = client_pages(api)
+    assert isinstance(page, CachedPage)
+    assert page == [{'id': 10}, {'id': 11}]
+
+    # Until whoever saved the records says so, the page comes back in full
+    page, = client_pages(api)
+    assert isinstance(page, CachedPage)
+    page.store()
+
+    page, = client_pages(api)
+    assert isinstance(page, UnchangedPage)
+    assert list(page) == [{'id': 10}, {'id': 11}]
+
+
+def test_disk_cache_is_only_listed_when_it_looks_full(tmpdir, monkeypatch):
+    listed = []
+    listdir = os.listdir
+    monkeypatch.setattr(httpcache.os, 'listdir', lambda path: listed.append(path) or listdir(path))
+
+    cache = DiskCache(str(tmpdir), max_bytes=5000)
+    entry = {'body': 'x' * 80}
+
+    for number in range(200):
+        cache.put('%03d' % number, entry)
+
+    sizes = [os.path.getsize(str(path)) for path in tmpdir.listdir()]
+
+    assert sum(sizes) <= 5000
+    assert len(listed) < 200 // 4
+    assert cache.get('199') == entry
+    assert cache.get('000') is None
@@ -0,0 +1,98 @@
+import time
+import email.utils
+
+import pytest
+
+from refresh2 import transport
+from refresh2.api import Urls
+from refresh2.exceptions import TransportError
+from refresh2.testing import FakeFreshbooks
+from refresh2.transport import Transport
+
+
+@pytest.fixture
+def server():
+    server = FakeFreshbooks()
+    server.add_business(1, 'abc', 'Business')
+
+    with server:
+        yield server
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(transport.time, 'sleep', sleeps.append)
+    return sleeps
+
+
+def test_server_errors_are_retried_with_backoff(server, sleeps):
+    server.queue_response(503)
+    server.queue_response(502)
+
+    response = Transport(server.session()).get(Urls.IDENTITY)
+
+    assert response.status_code == 200
+    assert len(server.requests) == 3
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 0.5 and 0 <= sleeps[1] <= 1.0
+
+
+def test_retry_after_seconds_are_honoured(server, sleeps):
+    server.queue_response(429, headers={'Retry-After': '7'})
+
+    assert Transport(server.session()).get(Urls.IDENTITY).status_code == 200
+    assert sleeps == [7]
+
+
+def test_retry_after_dates_are_honoured(server, sleeps):
+    server.queue_response(503, headers={
+        'Retry-After': email.utils.formatdate(time.time() + 30, usegmt=True)})
+
+    assert Transport(server.session()).get(Urls.IDENTITY).status_code == 200
+    assert len(sleeps) == 1 and 25 <= sleeps[0] <= 30
+
+
+def test_retry_after_is_capped_at_max_backoff(server, sleeps):
+    server.queue_response(429, headers={'Retry-After': '3600'})
+    server.queue_response(503, headers={
+        'Retry-After': email.utils.formatdate(time.time() + 3600, usegmt=True)})
+
+    assert Transport(server.session(), max_backoff=20).get(Urls.IDENTITY).status_code == 200
+    assert sleeps == [20, 20]
+
+
+def test_unparseable_retry_after_falls_back_to_backoff(server, sleeps):
+    server.queue_response(503, headers={'Retry-After': 'soon'})
+
+    assert Transport(server.session()).get(Urls.IDENTITY).status_code == 200
+    assert len(sleeps) == 1 and 0 <= sleeps[0] <= 0.5
+
+
+def test_gives_up_after_retries(server, sleeps):
+    for _ in range(3):
+        server.queue_response(503)
+
+    with pytest.raises(TransportError):
+        Transport(server.session(), retries=2).get(Urls.IDENTITY)
+
+    assert len(server.requests) == 3
+    assert len(sleeps) == 2
+
+
+def test_throttling_shrinks_the_limit_until_requests_go_through(server, sleeps):
+    session = Transport(server.session(), pool_size=8)
+    server.queue_response(429, headers={'Retry-After': '0'})
+
+    # Throttled with nothing else in flight, then one success grows it back
+    session.get(Urls.IDENTITY)
+    assert session.limiter.limit == 2
+
+    for _ in range(2):
+        session.get(Urls.IDENTITY)
+    assert session.limiter.limit == 3
+
+    # Server errors other than throttling leave the limit alone
+    server.queue_response(503)
+    session.get(Urls.IDENTITY)
+    assert session.limiter.limit == 3
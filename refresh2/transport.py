@@ -0,0 +1,159 @@
+import time
+import random
+import logging
+import threading
+import email.utils
+import requests
+from requests.adapters import HTTPAdapter
+from .exceptions import *
+
+logger = logging.getLogger('refresh2')
+
+POOL_SIZE = 10
+TIMEOUT = (10, 60)  # (connect, read) seconds
+RETRIES = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 60
+
+THROTTLED = 429
+RETRY_STATUSES = (THROTTLED, 500, 502, 503, 504)
+
+# Called as listener(event, seconds, **info) for every 'request' sent and
+# every 'decode' of a response body, e.g. to profile where time goes.
+listeners = []
+
+
+def notify(event, seconds, **info):
+    for listener in listeners:
+        listener(event, seconds, **info)
+
+
+def retry_after(response):
+    """ Seconds the server asked us to wait, if it said so """
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+
+    try:
+        return max(0, int(value))
+    except ValueError:
+        pass
+
+    date = email.utils.parsedate_tz(value)
+    if date is None:
+        return None
+
+    return max(0, email.utils.mktime_tz(date) - time.time())
+
+
+class AdaptiveLimiter(object):
+    """
+    Caps the number of requests in flight.  The cap is halved whenever the
+    server throttles us, and grows back by one for every `limit` requests
+    in a row that go through.
+    """
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = maximum
+        self.active = 0
+        self.successes = 0
+        self._condition = threading.Condition()
+
+    def __enter__(self):
+        with self._condition:
+            while self.active >= self.limit:
+                self._condition.wait()
+            self.active += 1
+
+    def __exit__(self, *exc_info):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def throttled(self):
+        with self._condition:
+            self.limit = max(1, min(self.limit, self.active + 1) // 2)
+            self.successes = 0
+
+    def succeeded(self):
+        with self._condition:
+            if self.limit >= self.maximum:
+                return
+
+            self.successes += 1
+            if self.successes >= self.limit:
+                self.limit += 1
+                self.successes = 0
+                self._condition.notify()
+
+
+class Transport(object):
+    """
+    Sends GET requests over a pooled session, retrying connection errors,
+    throttling and server errors with jittered exponential backoff.
+    Sessions that pass the same adapter share its connection pool.
+    """
+
+    def __init__(self, session, pool_size=POOL_SIZE, timeout=TIMEOUT,
+                 retries=RETRIES, backoff=BACKOFF, max_backoff=MAX_BACKOFF,
+                 adapter=None):
+        self.session = session
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limiter = AdaptiveLimiter(pool_size)
+
+        if adapter is None:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def backoff_delay(self, attempt):
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def get(self, url, params=None, headers=None):
+        attempt = 0
+
+        while True:
+            try:
+                with self.limiter:
+                    started = time.time()
+                    response = self.session.get(
+                        url, params=params, headers=headers, timeout=self.timeout)
+
+                if listeners:
+                    notify('request', time.time() - started,
+                           size=len(response.content), status=response.status_code)
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                if attempt >= self.retries:
+                    raise TransportError('%s: %s' % (ex, url))
+
+                delay = self.backoff_delay(attempt)
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.limiter.succeeded()
+                    return response
+
+                if response.status_code == THROTTLED:
+                    self.limiter.throttled()
+
+                if attempt >= self.retries:
+                    raise TransportError('HTTP %s after %s attempts: %s' % (
+                        response.status_code, attempt + 1, url))
+
+                # However long the server asks for, never hang a pull for longer
+                # than our own backoff would
+                delay = retry_after(response)
+                if delay is None:
+                    delay = self.backoff_delay(attempt)
+                else:
+                    delay = min(delay, self.max_backoff)
+
+                logger.debug('HTTP %s, retrying in %0.1fs: %s' % (
+                    response.status_code, delay, url))
+
+            time.sleep(delay)
+            attempt += 1
@@ -1,4 +1,5 @@
 import pprint as PrettyPrint
+import datetime
 import types
 
 
@@ -60,4 +61,12 @@ def safe_get(obj, key, default=None):
     if key in dic:
         return dic[key]
     else:
-        return default
\ No newline at end of file
+        return default
+
+
+def format_datetime(value):
+    """ Formats a naive UTC datetime the way the API expects it in filters. """
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+    else:
+        return value
@@ -1,3 +1,3 @@
 #!/bin/bash
 
-pytest --pyargs freshtools -v
+pytest --pyargs freshtools refresh2 -v